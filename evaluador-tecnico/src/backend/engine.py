@@ -1,17 +1,37 @@
 import os
+import re
+import sys
+import hmac
 import json
+import math
+import random
+import asyncio
+import itertools
 import uuid
-from typing import List, Optional
+import zlib
+import time
+import heapq
+import bisect
+import difflib
+import hashlib
+import threading
+import unicodedata
+from typing import List, Optional, Dict, Literal, TypedDict
+from contextvars import ContextVar
+from contextlib import contextmanager
 from glob import glob
 from datetime import datetime
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, Field
+from fastapi import FastAPI, HTTPException, Query, Request
+from pydantic import BaseModel, Field, ValidationError
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+from langchain_core.messages import SystemMessage, HumanMessage
 from langchain_core.output_parsers import JsonOutputParser
-from langgraph.graph import StateGraph, END
+from langchain_core.exceptions import OutputParserException
+from langgraph.graph import StateGraph, START, END
 from dotenv import load_dotenv
+import numpy as np
+import pandas as pd
 
 # Cargar variables de entorno
 load_dotenv()
@@ -29,13 +49,93 @@ if os.getenv("DOCKER_ENV"):
 # Asegurar que existe el directorio de datos
 os.makedirs(DATA_DIR, exist_ok=True)
 
+# Secreto único de administración (perfilado bajo demanda y retención). Sin él,
+# las funciones de administración quedan deshabilitadas.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+def is_admin(request: Request, header: str = "x-admin-token") -> bool:
+    """True si la cabecera `header` coincide con ADMIN_TOKEN."""
+    value = request.headers.get(header, "")
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(value, ADMIN_TOKEN)
+
 # Ayudante para obtener rutas de archivo basadas en ID
 def get_file_paths(eval_id: str):
     return {
         "eval": os.path.join(DATA_DIR, f"eval_{eval_id}.json"),
-        "transcript": os.path.join(DATA_DIR, f"transcript_{eval_id}.txt")
+        "transcript": os.path.join(DATA_DIR, f"transcript_{eval_id}.jsonl"),
+        "transcript_legacy": os.path.join(DATA_DIR, f"transcript_{eval_id}.txt"),
+        "cv": os.path.join(DATA_DIR, f"cv_{eval_id}.txt"),
+        "interview": os.path.join(DATA_DIR, f"interview_{eval_id}.json")
     }
 
+# Tiempos por fase de la petición en curso (se devuelven en la cabecera Server-Timing)
+request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+@contextmanager
+def timed_phase(name: str):
+    """Acumula la duración del bloque en la fase `name` de la petición actual."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = request_timings.get()
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+def load_json(path: str):
+    with timed_phase("disk"):
+        with open(path, "r", encoding="utf-8") as f:
+            raw = f.read()
+    with timed_phase("json"):
+        return json.loads(raw)
+
+def save_json(path: str, data):
+    with timed_phase("json"):
+        raw = json.dumps(data, indent=4)
+    with timed_phase("disk"):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(raw)
+
+def truncate_torn_tail(path: str):
+    """
+    Recorta una última línea incompleta (escritura interrumpida por una caída)
+    antes de añadir registros a un fichero JSONL, para no pegarlos a ella.
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        if end == 0:
+            return
+        f.seek(end - 1)
+        if f.read(1) == b"\n":
+            return
+        position = end
+        while position > 0:
+            read_size = min(8192, position)
+            position -= read_size
+            f.seek(position)
+            newline = f.read(read_size).rfind(b"\n")
+            if newline != -1:
+                f.truncate(position + newline + 1)
+                return
+        f.truncate(0)
+
+def live_evaluation_paths():
+    """(eval_id, ruta) de cada evaluación viva en DATA_DIR (las archivadas no)."""
+    for path in glob(os.path.join(DATA_DIR, "eval_*.json")):
+        yield os.path.basename(path)[len("eval_"):-len(".json")], path
+
+def iter_live_evaluations():
+    """(eval_id, datos, ruta) de cada evaluación viva; las ilegibles se omiten."""
+    for eval_id, path in live_evaluation_paths():
+        try:
+            data = load_json(path)
+        except Exception:
+            continue
+        yield eval_id, data, path
+
 # Factoría de LLM
 def get_llm_model():
     """
@@ -56,6 +156,314 @@ def get_llm_model():
 
 llm = get_llm_model()
 
+# --- PLANIFICADOR DE TRÁFICO LLM ---
+# Todas las llamadas al proveedor pasan por `call_llm`, que aplica límites de
+# peticiones/tokens por minuto (token bucket) y prioridades: los turnos de
+# entrevista van antes que las auditorías y éstas antes que los análisis.
+
+PRIORITY_INTERVIEW = 0
+PRIORITY_AUDIT = 1
+PRIORITY_ANALYSIS = 2
+PRIORITY_NAMES = {PRIORITY_INTERVIEW: "interview", PRIORITY_AUDIT: "audit", PRIORITY_ANALYSIS: "analysis"}
+
+LLM_RPM = int(os.getenv("LLM_RPM", "500"))
+LLM_TPM = int(os.getenv("LLM_TPM", "30000"))
+LLM_QUEUE_MAX_DEPTH = int(os.getenv("LLM_QUEUE_MAX_DEPTH", "50"))
+LLM_EXPECTED_OUTPUT_TOKENS = int(os.getenv("LLM_EXPECTED_OUTPUT_TOKENS", "800"))
+
+class TokenBucket:
+    """Cubo de tokens que se rellena de forma continua hasta `per_minute`."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.available = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.rate
+
+    def consume(self, amount: float):
+        self._refill()
+        self.available -= min(amount, self.capacity)
+
+    def adjust(self, delta: float):
+        """Corrige el consumo estimado con el real (puede dejar el cubo en negativo)."""
+        self._refill()
+        self.available = min(self.capacity, self.available - delta)
+
+class LLMScheduler:
+    """Control de admisión con colas por prioridad de profundidad acotada."""
+
+    def __init__(self, rpm: int, tpm: int, max_depth: int):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_depth = max_depth
+        self.queue = []
+        self.depth = {p: 0 for p in PRIORITY_NAMES}
+        # Tokens estimados en cola por prioridad (para calcular Retry-After)
+        self.queued_tokens = {p: 0 for p in PRIORITY_NAMES}
+        self.sequence = itertools.count()
+        self.dispatcher = None
+        self.stats = {
+            name: {"admitted": 0, "rejected": 0, "wait_ms_total": 0.0, "wait_ms_max": 0.0}
+            for name in PRIORITY_NAMES.values()
+        }
+
+    def _wait_time(self, estimated_tokens: int) -> float:
+        return max(self.requests.wait_time(1), self.tokens.wait_time(estimated_tokens))
+
+    def _grant(self, estimated_tokens: int):
+        self.requests.consume(1)
+        self.tokens.consume(estimated_tokens)
+
+    def retry_after(self, priority: int) -> int:
+        """
+        Segundos estimados hasta vaciar lo que va por delante en la cola: el límite
+        efectivo es el más restrictivo de los dos cubos (peticiones o tokens).
+        """
+        ahead_requests = sum(depth for p, depth in self.depth.items() if p <= priority)
+        ahead_tokens = sum(tokens for p, tokens in self.queued_tokens.items() if p <= priority)
+        self.requests._refill()
+        self.tokens._refill()
+        seconds = max(
+            (ahead_requests - self.requests.available) / max(self.requests.rate, 1e-9),
+            (ahead_tokens - self.tokens.available) / max(self.tokens.rate, 1e-9)
+        )
+        return max(1, math.ceil(seconds))
+
+    async def acquire(self, priority: int, estimated_tokens: int) -> float:
+        """Espera turno para una llamada; devuelve los segundos pasados en cola."""
+        name = PRIORITY_NAMES[priority]
+        start = time.monotonic()
+        if not self.queue and self._wait_time(estimated_tokens) == 0:
+            self._grant(estimated_tokens)
+            self.stats[name]["admitted"] += 1
+            return 0.0
+
+        if self.depth[priority] >= self.max_depth:
+            self.stats[name]["rejected"] += 1
+            raise HTTPException(
+                status_code=503,
+                detail=f"Cola de peticiones al LLM llena ({name}). Inténtalo más tarde.",
+                headers={"Retry-After": str(self.retry_after(priority))}
+            )
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.queue, (priority, next(self.sequence), estimated_tokens, future))
+        self.depth[priority] += 1
+        self.queued_tokens[priority] += estimated_tokens
+        if self.dispatcher is None or self.dispatcher.done():
+            self.dispatcher = asyncio.create_task(self._dispatch())
+        try:
+            await future
+        finally:
+            if not future.done() or future.cancelled():
+                future.cancel()
+
+        waited = time.monotonic() - start
+        stats = self.stats[name]
+        stats["admitted"] += 1
+        stats["wait_ms_total"] += waited * 1000
+        stats["wait_ms_max"] = max(stats["wait_ms_max"], waited * 1000)
+        return waited
+
+    async def _dispatch(self):
+        while self.queue:
+            priority, _, estimated_tokens, future = self.queue[0]
+            if future.done():
+                heapq.heappop(self.queue)
+                self.depth[priority] -= 1
+                self.queued_tokens[priority] -= estimated_tokens
+                continue
+            delay = self._wait_time(estimated_tokens)
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            heapq.heappop(self.queue)
+            self.depth[priority] -= 1
+            self.queued_tokens[priority] -= estimated_tokens
+            self._grant(estimated_tokens)
+            future.set_result(None)
+
+    def reconcile(self, estimated_tokens: int, actual_tokens: int):
+        self.tokens.adjust(actual_tokens - estimated_tokens)
+
+    def snapshot(self) -> dict:
+        result = {"rpm": int(self.requests.capacity), "tpm": int(self.tokens.capacity), "max_queue_depth": self.max_depth}
+        for priority, name in PRIORITY_NAMES.items():
+            stats = self.stats[name]
+            result[name] = {
+                "queue_depth": self.depth[priority],
+                "admitted": stats["admitted"],
+                "rejected": stats["rejected"],
+                "avg_wait_ms": round(stats["wait_ms_total"] / stats["admitted"], 1) if stats["admitted"] else 0.0,
+                "max_wait_ms": round(stats["wait_ms_max"], 1)
+            }
+        return result
+
+llm_scheduler = LLMScheduler(LLM_RPM, LLM_TPM, LLM_QUEUE_MAX_DEPTH)
+
+def estimate_tokens(messages: list) -> int:
+    return sum(len(str(m.content)) for m in messages) // 4 + LLM_EXPECTED_OUTPUT_TOKENS
+
+def provider_retry_after(error: Exception) -> Optional[int]:
+    """Si el proveedor respondió 429, devuelve el Retry-After sugerido (en segundos)."""
+    if getattr(error, "status_code", None) != 429:
+        return None
+    response = getattr(error, "response", None)
+    header = response.headers.get("retry-after") if response is not None else None
+    try:
+        return max(1, math.ceil(float(header)))
+    except (TypeError, ValueError):
+        return 1
+
+async def call_llm(messages: list, priority: int, runnable=None):
+    """Punto único de salida hacia el proveedor (admisión, prioridad y límites)."""
+    runnable = runnable or llm
+    estimated = estimate_tokens(messages)
+    with timed_phase("llm-queue"):
+        await llm_scheduler.acquire(priority, estimated)
+    try:
+        with timed_phase("llm"):
+            output = await runnable.ainvoke(messages)
+    except Exception as e:
+        retry_after = provider_retry_after(e)
+        if retry_after is None:
+            raise
+        raise HTTPException(
+            status_code=503,
+            detail="El proveedor del LLM ha limitado las peticiones. Inténtalo más tarde.",
+            headers={"Retry-After": str(retry_after)}
+        )
+
+    raw = output.get("raw") if isinstance(output, dict) else output
+    usage = getattr(raw, "usage_metadata", None)
+    if usage and usage.get("total_tokens"):
+        llm_scheduler.reconcile(estimated, usage["total_tokens"])
+    return output
+
+# Salida estructurada: "function_calling" (tool calling), "json_schema" o "json_mode"
+# usan el modo nativo del proveedor; "prompt" mantiene el esquema embebido en el prompt.
+STRUCTURED_OUTPUT_METHOD = os.getenv("LLM_STRUCTURED_OUTPUT", "function_calling").lower()
+
+structured_output_metrics = {
+    "calls": 0,
+    "parse_failures": 0,
+    "repairs_succeeded": 0,
+    "repairs_failed": 0,
+    "prompt_tokens_saved": 0
+}
+
+_structured_llms = {}
+_format_instruction_tokens = {}
+
+def get_structured_llm(schema):
+    """Devuelve (y cachea) el modelo configurado para producir directamente `schema`."""
+    if schema not in _structured_llms:
+        # Se pasa el JSON schema (no la clase) para validar con pydantic por separado
+        _structured_llms[schema] = llm.with_structured_output(schema.model_json_schema(), method=STRUCTURED_OUTPUT_METHOD, include_raw=True)
+    return _structured_llms[schema]
+
+def count_tokens(text: str) -> int:
+    try:
+        return llm.get_num_tokens(text)
+    except Exception:
+        return len(text) // 4
+
+def saved_prompt_tokens(schema) -> int:
+    """Estimación de tokens ahorrados: instrucciones de formato menos la definición nativa del esquema."""
+    if schema not in _format_instruction_tokens:
+        instructions = JsonOutputParser(pydantic_object=schema).get_format_instructions()
+        native = json.dumps(schema.model_json_schema())
+        _format_instruction_tokens[schema] = max(count_tokens(instructions) - count_tokens(native), 0)
+    return _format_instruction_tokens[schema]
+
+def with_appended_text(messages: list, text: str) -> list:
+    last = messages[-1]
+    return messages[:-1] + [last.__class__(content=f"{last.content}\n\n{text}")]
+
+async def invoke_structured(messages: list, schema, priority: int) -> dict:
+    """
+    Invoca el LLM pidiendo un objeto `schema` validado con pydantic.
+    Si la respuesta no es válida se hace un único reintento de reparación;
+    si vuelve a fallar se devuelve un 502 en lugar de un error genérico.
+    """
+    structured_output_metrics["calls"] += 1
+
+    async def attempt(msgs):
+        if STRUCTURED_OUTPUT_METHOD == "prompt":
+            parser = JsonOutputParser(pydantic_object=schema)
+            response = await call_llm(with_appended_text(msgs, parser.get_format_instructions()), priority)
+            try:
+                with timed_phase("parse"):
+                    data = parser.parse(response.content)
+                with timed_phase("pydantic"):
+                    return schema.model_validate(data), None
+            except (OutputParserException, ValidationError) as e:
+                return None, (response.content, e)
+
+        output = await call_llm(msgs, priority, runnable=get_structured_llm(schema))
+        raw = output.get("raw")
+        raw_text = raw.content if raw is not None else ""
+        if raw is not None and getattr(raw, "tool_calls", None):
+            raw_text = json.dumps(raw.tool_calls[0]["args"], ensure_ascii=False)
+        if output.get("parsing_error") is not None or output.get("parsed") is None:
+            return None, (raw_text, output.get("parsing_error") or ValueError("Respuesta vacía"))
+        try:
+            with timed_phase("pydantic"):
+                return schema.model_validate(output["parsed"]), None
+        except ValidationError as e:
+            return None, (raw_text, e)
+
+    if STRUCTURED_OUTPUT_METHOD != "prompt":
+        structured_output_metrics["prompt_tokens_saved"] += saved_prompt_tokens(schema)
+
+    parsed, failure = await attempt(messages)
+    if failure is not None:
+        structured_output_metrics["parse_failures"] += 1
+        raw_text, error = failure
+        repair_messages = messages + [HumanMessage(content=(
+            f"Tu respuesta anterior no cumple el esquema requerido.\n\nRESPUESTA:\n{raw_text}\n\n"
+            f"ERROR DE VALIDACIÓN:\n{error}\n\nDevuelve de nuevo el objeto completo y corregido."
+        ))]
+        parsed, failure = await attempt(repair_messages)
+        if failure is not None:
+            structured_output_metrics["repairs_failed"] += 1
+            raise HTTPException(status_code=502, detail=f"Respuesta del modelo no válida tras reintento: {failure[1]}")
+        structured_output_metrics["repairs_succeeded"] += 1
+
+    return parsed.model_dump()
+
+def recalculate_score(data: dict):
+    """
+    Lógica de Cálculo de Score Robusta (Python).
+    Evitamos confiar en las matemáticas del LLM.
+    """
+    matching = data.get("matching_requirements", [])
+    unmatching = data.get("unmatching_requirements", [])
+    not_found = data.get("not_found_requirements", [])
+
+    total_reqs = len(matching) + len(unmatching) + len(not_found)
+    data["total_requirements"] = total_reqs
+
+    if data.get("discarded", False):
+        data["score"] = 0.0
+    else:
+        if total_reqs > 0:
+            data["score"] = round((len(matching) / total_reqs) * 100, 1)
+        else:
+            data["score"] = 0.0
+
 # --- MÓDULO 1: MOTOR DE ANÁLISIS DE CV ---
 
 class AnalysisResult(BaseModel):
@@ -71,17 +479,51 @@ class AnalysisResult(BaseModel):
 
 class AnalyzeRequest(BaseModel):
     cv_text: str
-    offer_text: str
+    offer_text: Optional[str] = None
+    offer_id: Optional[str] = None
     first_name: str
     last_name: str
     dni: str
+    full_reanalysis: bool = False
+
+def store_new_evaluation(result: dict, cv_text: str, previous_id: Optional[str] = None) -> str:
+    """Persiste una evaluación nueva y actualiza índices y agregados; devuelve su ID."""
+    # Generar ID Único
+    eval_id = str(uuid.uuid4())
+    paths = get_file_paths(eval_id)
+
+    # Guardar Evaluación Inicial
+    save_json(paths['eval'], result)
+
+    # Guardar CV original para búsquedas y re-evaluaciones posteriores
+    with open(paths['cv'], "w", encoding="utf-8") as f:
+        f.write(cv_text)
+
+    # Un reenvío sustituye a la evaluación previa en búsquedas y agregados de la oferta
+    previous_data = None
+    if previous_id and os.path.exists(get_file_paths(previous_id)["eval"]):
+        previous_data = load_json(get_file_paths(previous_id)["eval"])
+        search_index.remove(previous_id)
+    elif previous_id:
+        bundle = archive_store.read(previous_id)
+        previous_data = bundle["evaluation"] if bundle else None
+
+    search_index.upsert(eval_id, result, cv_text)
+    offer_store.record_evaluation(result["offer_id"], eval_id, previous_data, result, replaces=previous_id)
+    evaluation_history.record(result["dni"], result["offer_id"], eval_id)
+    analytics_store.record(eval_id, result, "analysis")
+    return eval_id
 
 @app.post("/analyze")
 async def analyze_cv(request: AnalyzeRequest):
-    parser = JsonOutputParser(pydantic_object=AnalysisResult)
+    # Resolver la oferta (por ID o registrándola a partir de su texto)
+    offer = offer_store.resolve(request.offer_id, request.offer_text)
     
     # Construcción explícita del nombre
     full_name = f"{request.first_name} {request.last_name}"
+
+    # Evaluación previa del mismo DNI para la misma oferta (reenvío de CV)
+    previous_id = evaluation_history.latest(request.dni, offer["offer_id"])
     
     # Prompt del Sistema para Fase 1
     system_prompt = """
@@ -104,51 +546,193 @@ REGLAS CRÍTICAS:
     
     messages = [
         SystemMessage(content=system_prompt),
-        HumanMessage(content=f"OFERTA:\n{request.offer_text}\n\nCV:\n{request.cv_text}\n\n{parser.get_format_instructions()}")
+        HumanMessage(content=f"OFERTA:\n{offer['offer_text']}\n\nCV:\n{request.cv_text}")
     ]
     
     try:
-        response = llm.invoke(messages)
-        result = parser.parse(response.content)
+        result = None
+        if previous_id and not request.full_reanalysis:
+            # Re-evaluación incremental: solo los requisitos afectados por el cambio
+            result = await incremental_reanalysis(previous_id, offer["offer_text"], request.cv_text)
+
+        if result is None:
+            result = await invoke_structured(messages, AnalysisResult, PRIORITY_ANALYSIS)
+            if previous_id:
+                result["previous_evaluation_id"] = previous_id
+                result["reevaluation_mode"] = "full"
         
         # Sobrescribir/Inyectar Datos de Identidad Explícitos
         result["candidate_name"] = full_name
         result["dni"] = request.dni
+        result["offer_id"] = offer["offer_id"]
+        result["created_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-        # Lógica de Cálculo de Score Robusta (Python)
-        # Evitamos confiar en las matemáticas del LLM
-        matching = result.get("matching_requirements", [])
-        unmatching = result.get("unmatching_requirements", [])
-        not_found = result.get("not_found_requirements", [])
-        
-        total_reqs = len(matching) + len(unmatching) + len(not_found)
-        result["total_requirements"] = total_reqs
+        recalculate_score(result)
+        result["initial_score"] = result["score"]
+        if result.get("reevaluation_mode") == "full":
+            result["reevaluated_requirements"] = result["total_requirements"]
+            result["carried_over_requirements"] = 0
         
-        if result.get("discarded", False):
-            result["score"] = 0.0
-        else:
-            if total_reqs > 0:
-                result["score"] = round((len(matching) / total_reqs) * 100, 1)
-            else:
-                result["score"] = 0.0
-        
-        # Generar ID Único
-        eval_id = str(uuid.uuid4())
-        paths = get_file_paths(eval_id)
-        
-        # Guardar Evaluación Inicial
-        with open(paths['eval'], "w", encoding="utf-8") as f:
-            json.dump(result, f, indent=4)
+        eval_id = store_new_evaluation(result, request.cv_text, previous_id)
             
         # Devolver resultado con ID
         result["evaluation_id"] = eval_id
         return result
-        
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # --- MÓDULO 2: AGENTE DE ENTREVISTA ---
 
+# La entrevista es una máquina de estados explícita (LangGraph):
+#   saludo -> preguntar requisito i -> clasificar respuesta -> repreguntar | avanzar -> cierre
+# El estado se guarda en `interview_{id}.json` tras cada turno. Saludo, preguntas y
+# cierre salen de plantillas; el LLM solo clasifica respuestas y redacta repreguntas.
+
+INTERVIEW_MAX_FOLLOW_UPS = int(os.getenv("INTERVIEW_MAX_FOLLOW_UPS", "1"))
+
+GREETING_TEMPLATE = "Hola {name}, soy el Asistente Virtual de Evaluación Técnica. Necesito corroborar algunos puntos de tu perfil antes de completar la evaluación."
+GREETING_COMPLETE_TEMPLATE = "Hola {name}, soy el Asistente Virtual de Evaluación Técnica. Tu perfil cubre toda la información que necesitamos para esta oferta."
+QUESTION_TEMPLATE = "Sobre el requisito «{requirement}»: ¿lo cumples? Cuéntame brevemente en qué proyectos o contexto lo has acreditado."
+ADVANCE_TEMPLATE = "Gracias, queda anotado."
+FOLLOW_UP_TEMPLATE = "Sobre el requisito «{requirement}»: ¿podrías concretar un poco más?"
+CLOSING_TEMPLATE = "Muchas gracias, {name}. Ya tengo toda la información necesaria. Puedes pulsar \"Finalizar Entrevista\" para completar el proceso."
+ALREADY_CLOSED_TEMPLATE = "La entrevista ya ha finalizado. Puedes pulsar \"Finalizar Entrevista\" para completar el proceso."
+
+interview_metrics = {
+    "turns": 0,
+    "llm_calls": 0,
+    "template_messages": 0
+}
+
+class InterviewState(TypedDict):
+    evaluation_id: str
+    candidate_name: str
+    pending: List[str]
+    index: int
+    follow_ups: int
+    phase: str  # "start" | "awaiting_answer" | "closed"
+    last_question: str
+    last_answer: str
+    classification: dict
+    answers: Dict[str, dict]
+    reply: List[str]
+
+class AnswerClassification(BaseModel):
+    status: Literal["matching", "unmatching", "unclear"] = Field(description="'matching' si confirma el requisito, 'unmatching' si confirma NO tenerlo, 'unclear' si la respuesta es vaga o no responde.")
+    evidence: str = Field(description="Resumen breve de lo que ha dicho el candidato sobre el requisito.")
+    follow_up: str = Field(default="", description="Si status es 'unclear', una única repregunta breve y concreta sobre el requisito.")
+
+def say(state: InterviewState, message: str) -> List[str]:
+    return state["reply"] + [message]
+
+def route_interview(state: InterviewState) -> str:
+    if state["phase"] == "start":
+        return "greet"
+    if state["phase"] == "awaiting_answer":
+        return "classify"
+    return "already_closed"
+
+def greet_node(state: InterviewState):
+    template = GREETING_TEMPLATE if state["pending"] else GREETING_COMPLETE_TEMPLATE
+    interview_metrics["template_messages"] += 1
+    return {"reply": say(state, template.format(name=state["candidate_name"]))}
+
+def ask_node(state: InterviewState):
+    question = QUESTION_TEMPLATE.format(requirement=state["pending"][state["index"]])
+    interview_metrics["template_messages"] += 1
+    return {"reply": say(state, question), "last_question": question, "follow_ups": 0, "phase": "awaiting_answer"}
+
+async def classify_node(state: InterviewState):
+    requirement = state["pending"][state["index"]]
+    system_prompt = """
+Eres el "Asistente Virtual de Evaluación Técnica". Clasifica la respuesta del candidato sobre UN requisito de la oferta.
+- `matching`: confirma tener la experiencia requerida.
+- `unmatching`: confirma NO tenerla.
+- `unclear`: respuesta vaga, evasiva o que no responde; en ese caso redacta en `follow_up` una única repregunta breve y profesional.
+"""
+    messages = [
+        SystemMessage(content=system_prompt),
+        HumanMessage(content=f"REQUISITO: {requirement}\n\nPREGUNTA: {state['last_question']}\n\nRESPUESTA DEL CANDIDATO: {state['last_answer']}")
+    ]
+    interview_metrics["llm_calls"] += 1
+    classification = await invoke_structured(messages, AnswerClassification, PRIORITY_INTERVIEW)
+    answers = dict(state["answers"])
+    answers[requirement] = {"status": classification["status"], "evidence": classification["evidence"]}
+    return {"classification": classification, "answers": answers}
+
+def after_classify(state: InterviewState) -> str:
+    if state["classification"]["status"] == "unclear" and state["follow_ups"] < INTERVIEW_MAX_FOLLOW_UPS:
+        return "follow_up"
+    return "advance"
+
+def follow_up_node(state: InterviewState):
+    question = state["classification"].get("follow_up") or FOLLOW_UP_TEMPLATE.format(requirement=state["pending"][state["index"]])
+    return {"reply": say(state, question), "last_question": question, "follow_ups": state["follow_ups"] + 1}
+
+def advance_node(state: InterviewState):
+    interview_metrics["template_messages"] += 1
+    return {"reply": say(state, ADVANCE_TEMPLATE), "index": state["index"] + 1}
+
+def after_greet_or_advance(state: InterviewState) -> str:
+    return "ask" if state["index"] < len(state["pending"]) else "close"
+
+def close_node(state: InterviewState):
+    interview_metrics["template_messages"] += 1
+    return {"reply": say(state, CLOSING_TEMPLATE.format(name=state["candidate_name"])), "phase": "closed"}
+
+def already_closed_node(state: InterviewState):
+    interview_metrics["template_messages"] += 1
+    return {"reply": say(state, ALREADY_CLOSED_TEMPLATE)}
+
+def build_interview_graph():
+    builder = StateGraph(InterviewState)
+    builder.add_node("greet", greet_node)
+    builder.add_node("ask", ask_node)
+    builder.add_node("classify", classify_node)
+    builder.add_node("follow_up", follow_up_node)
+    builder.add_node("advance", advance_node)
+    builder.add_node("close", close_node)
+    builder.add_node("already_closed", already_closed_node)
+
+    builder.add_conditional_edges(START, route_interview, ["greet", "classify", "already_closed"])
+    builder.add_conditional_edges("greet", after_greet_or_advance, ["ask", "close"])
+    builder.add_conditional_edges("classify", after_classify, ["follow_up", "advance"])
+    builder.add_conditional_edges("advance", after_greet_or_advance, ["ask", "close"])
+    # Tras preguntar o repreguntar el grafo se detiene a esperar la respuesta del candidato
+    builder.add_edge("ask", END)
+    builder.add_edge("follow_up", END)
+    builder.add_edge("close", END)
+    builder.add_edge("already_closed", END)
+    return builder.compile()
+
+interview_graph = build_interview_graph()
+
+def new_interview_state(eval_id: str, eval_data: dict) -> InterviewState:
+    return {
+        "evaluation_id": eval_id,
+        "candidate_name": eval_data.get("candidate_name", "Candidato"),
+        "pending": list(eval_data.get("not_found_requirements", [])),
+        "index": 0,
+        "follow_ups": 0,
+        "phase": "start",
+        "last_question": "",
+        "last_answer": "",
+        "classification": {},
+        "answers": {},
+        "reply": []
+    }
+
+async def run_interview_turn(state: InterviewState, candidate_message: str = "") -> InterviewState:
+    """Ejecuta el grafo hasta el siguiente punto de espera y guarda el checkpoint."""
+    state = {**state, "last_answer": candidate_message, "reply": []}
+    state = await interview_graph.ainvoke(state)
+    save_json(get_file_paths(state["evaluation_id"])["interview"], state)
+    interview_metrics["turns"] += 1
+    return state
+
 class ChatRequest(BaseModel):
     evaluation_id: str
     message: str
@@ -160,6 +744,7 @@ class StartInterviewRequest(BaseModel):
 class ChatResponse(BaseModel):
     response: str
     history: List[dict]
+    finished: bool = False
 
 @app.post("/interview", response_model=ChatResponse)
 async def conduct_interview(request: ChatRequest):
@@ -168,50 +753,26 @@ async def conduct_interview(request: ChatRequest):
     if not os.path.exists(paths['eval']):
          raise HTTPException(status_code=404, detail="Evaluation ID not found")
 
-    with open(paths['eval'], "r", encoding="utf-8") as f:
-        eval_data = json.load(f)
-        
-    missing = eval_data.get("not_found_requirements", [])
-    candidate_name = eval_data.get("candidate_name", "Candidato")
-
-    system_prompt = f"""
-Eres el "Asistente Virtual de Evaluación Técnica". Tu tono es profesional, neutral y eficiente.
-Tu objetivo es verificar ÚNICAMENTE los requisitos que aparecen en la lista de 'No Encontrados'.
-
-INSTRUCCIONES CLAVE:
-1. Pregunta UNO POR UNO. No agrupes preguntas.
-2. Inicia saludando a {candidate_name} y mencionando que necesitas corroborar algunos puntos.
-3. Si la lista de 'No Encontrados' está vacía ({missing}), procede al cierre indicando que tienes toda la información.
-4. NO preguntes sobre requisitos ya cumplidos.
-5. Sé breve y directo.
-"""
-    
-    # Actualizar Transcripción
-    with open(paths['transcript'], "a", encoding="utf-8") as f:
-        f.write(f"Candidato: {request.message}\n")
+    if os.path.exists(paths['interview']):
+        state = load_json(paths['interview'])
+    else:
+        # Entrevista sin checkpoint (no iniciada con /interview/start): se retoma desde la primera pregunta
+        state = new_interview_state(request.evaluation_id, load_json(paths['eval']))
+        state["phase"] = "awaiting_answer" if state["pending"] else "closed"
+        state["last_question"] = QUESTION_TEMPLATE.format(requirement=state["pending"][0]) if state["pending"] else ""
 
-    # Construir Mensajes LangChain
-    messages = [SystemMessage(content=system_prompt)]
-    for msg in request.history:
-        if msg["role"] == "user":
-            messages.append(HumanMessage(content=msg["content"]))
-        elif msg["role"] == "assistant":
-            messages.append(AIMessage(content=msg["content"]))
-    messages.append(HumanMessage(content=request.message))
-    
-    response = llm.invoke(messages)
-    ai_response = response.content
+    state = await run_interview_turn(state, request.message)
+    ai_response = "\n\n".join(state["reply"])
 
-    # Guardar Respuesta del Agente en Transcripción
-    with open(paths['transcript'], "a", encoding="utf-8") as f:
-        f.write(f"Evaluador: {ai_response}\n")
+    # Guardar el turno completo (candidato + evaluador) en una única escritura
+    append_transcript_turn(request.evaluation_id, request.message, ai_response)
 
     new_history = request.history + [
         {"role": "user", "content": request.message},
         {"role": "assistant", "content": ai_response}
     ]
 
-    return ChatResponse(response=ai_response, history=new_history)
+    return ChatResponse(response=ai_response, history=new_history, finished=state["phase"] == "closed")
 
 @app.post("/interview/start", response_model=ChatResponse)
 async def start_interview(request: StartInterviewRequest):
@@ -220,31 +781,17 @@ async def start_interview(request: StartInterviewRequest):
     if not os.path.exists(paths['eval']):
          raise HTTPException(status_code=404, detail="Evaluation ID not found")
          
-    # Inicializar transcripción
-    with open(paths['transcript'], "w", encoding="utf-8") as f:
-        f.write("--- INICIO ENTREVISTA ---\n")
+    eval_data = load_json(paths['eval'])
 
-    with open(paths['eval'], "r", encoding="utf-8") as f:
-        eval_data = json.load(f)
-        
-    missing = eval_data.get("not_found_requirements", [])
-    candidate_name = eval_data.get("candidate_name", "Candidato")
+    # Saludo + primera pregunta (o cierre directo si no hay requisitos pendientes), sin LLM
+    state = await run_interview_turn(new_interview_state(request.evaluation_id, eval_data))
+    ai_response = "\n\n".join(state["reply"])
 
-    system_prompt = f"""
-Eres el "Asistente Virtual de Evaluación Técnica".
-Tu tarea: Dar la bienvenida a {candidate_name} y hacer la PRIMERA pregunta sobre la lista de requisitos no encontrados: {missing}.
-Si no hay requisitos faltantes, simplemente saluda y di que el perfil es completo.
-MANTÉN EL TONO PROFESIONAL.
-"""
-    messages = [SystemMessage(content=system_prompt)]
-    response = llm.invoke(messages)
-    ai_response = response.content
-    
-    with open(paths['transcript'], "a", encoding="utf-8") as f:
-        f.write(f"Evaluador: {ai_response}\n")
+    # Inicializar transcripción (turno 0: saludo del evaluador)
+    start_transcript(request.evaluation_id, ai_response)
 
     initial_history = [{"role": "assistant", "content": ai_response}]
-    return ChatResponse(response=ai_response, history=initial_history)
+    return ChatResponse(response=ai_response, history=initial_history, finished=state["phase"] == "closed")
 
 
 
@@ -261,17 +808,18 @@ class AuditRequest(BaseModel):
 @app.post("/audit")
 async def audit_interview(request: AuditRequest):
     paths = get_file_paths(request.evaluation_id)
-    if not os.path.exists(paths['eval']) or not os.path.exists(paths['transcript']):
+    if not os.path.exists(paths['eval']) or not transcript_exists(request.evaluation_id):
          raise HTTPException(status_code=404, detail="Data not found for this ID")
 
-    with open(paths['eval'], "r", encoding="utf-8") as f:
-        initial_eval_data = json.load(f)
+    initial_eval_data = load_json(paths['eval'])
     
-    with open(paths['transcript'], "r", encoding="utf-8") as f:
-        transcript = f.read()
+    transcript = render_transcript_text(read_transcript(request.evaluation_id))
+
+    # Clasificación preliminar hecha por el agente de entrevista (si existe)
+    interview_answers = {}
+    if os.path.exists(paths['interview']):
+        interview_answers = load_json(paths['interview']).get("answers", {})
 
-    parser = JsonOutputParser(pydantic_object=AuditResult)
-    
     # Prompt
     system_prompt = f"""
 Actúa como un Auditor de Datos del Sistema Core. Recibirás el análisis inicial del CV y la transcripción de la entrevista. Tu tarea es generar el objeto JSON final actualizado y un resumen.
@@ -296,43 +844,51 @@ JSON INICIAL:
 TRANSCRIPCIÓN:
 {transcript}
 
-{parser.get_format_instructions()}
+CLASIFICACIÓN PRELIMINAR DE LA ENTREVISTA (orientativa):
+{json.dumps(interview_answers, ensure_ascii=False)}
 """
     
     messages = [SystemMessage(content=system_prompt)]
     try:
-        response = llm.invoke(messages)
-        result = parser.parse(response.content)
+        result = await invoke_structured(messages, AuditResult, PRIORITY_AUDIT)
         
         # Guardar Evaluación Final (Sobrescribir inicial para ser el registro principal)
         result["evaluation"]["candidate_name"] = initial_eval_data.get("candidate_name", "Unknown") # preservar nombre
         
         # Recálculo Robusto de Score en Auditoría
+        # (not_found debería estar vacío o casi vacío tras entrevista)
         eval_data_res = result["evaluation"]
-        matching = eval_data_res.get("matching_requirements", [])
-        unmatching = eval_data_res.get("unmatching_requirements", [])
-        not_found = eval_data_res.get("not_found_requirements", []) # Debería estar vacío o casi vacío tras entrevista
-        
-        total_reqs = len(matching) + len(unmatching) + len(not_found)
-        eval_data_res["total_requirements"] = total_reqs
-        
-        if eval_data_res.get("discarded", False):
-            eval_data_res["score"] = 0.0
-        else:
-            if total_reqs > 0:
-                eval_data_res["score"] = round((len(matching) / total_reqs) * 100, 1)
-            else:
-                eval_data_res["score"] = 0.0
+        recalculate_score(eval_data_res)
 
         # Para mantener compatibilidad con lecturas de AnalysisResult en otros lugares, guardaremos campos en el dict principal.
         final_data = eval_data_res
         final_data["key_points"] = result.get("key_points", [])
         final_data["red_flags"] = result.get("red_flags", [])
+        # Preservar identidad y vínculo con la oferta
+        final_data["dni"] = initial_eval_data.get("dni", final_data.get("dni", ""))
+        for key in ("offer_id", "created_at", "previous_evaluation_id", "reevaluation_mode",
+                    "reevaluated_requirements", "carried_over_requirements"):
+            if key in initial_eval_data:
+                final_data[key] = initial_eval_data[key]
+        final_data["initial_score"] = initial_eval_data.get("initial_score", initial_eval_data.get("score", 0))
+        final_data["audited_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
-        with open(paths['eval'], "w", encoding="utf-8") as f:
-            json.dump(final_data, f, indent=4)
+        save_json(paths['eval'], final_data)
+
+        # Si un reenvío ya sustituyó a esta evaluación, la auditoría se guarda
+        # pero no vuelve a entrar en búsquedas ni en los agregados de la oferta
+        latest_id = request.evaluation_id
+        if final_data.get("dni") and final_data.get("offer_id"):
+            latest_id = evaluation_history.latest(final_data["dni"], final_data["offer_id"]) or request.evaluation_id
+        if latest_id == request.evaluation_id:
+            search_index.upsert(request.evaluation_id, final_data, read_cv_text(request.evaluation_id))
+            if final_data.get("offer_id"):
+                offer_store.record_evaluation(final_data["offer_id"], request.evaluation_id, initial_eval_data, final_data)
+        analytics_store.record(request.evaluation_id, final_data, "final")
             
         return result
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -341,46 +897,1914 @@ TRANSCRIPCIÓN:
 @app.get("/evaluations")
 async def get_all_evaluations():
     """Listar todas las evaluaciones para el panel."""
-    files = glob(os.path.join(DATA_DIR, "eval_*.json"))
     results = []
     
-    for file in files:
-        try:
-            with open(file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                
-            results.append({
-                "id": os.path.basename(file).replace("eval_", "").replace(".json", ""),
-                "candidate_name": data.get("candidate_name", "Unknown"),
-                "score": data.get("score", 0),
-                "discarded": data.get("discarded", False),
-                "total_requirements": data.get("total_requirements", 0),
-                "timestamp": datetime.fromtimestamp(os.path.getmtime(file)).strftime("%Y-%m-%d %H:%M:%S")
-            })
-        except Exception:
-            continue
+    for eval_id, data, file in iter_live_evaluations():
+        results.append({
+            "id": eval_id,
+            "candidate_name": data.get("candidate_name", "Unknown"),
+            "score": data.get("score", 0),
+            "discarded": data.get("discarded", False),
+            "total_requirements": data.get("total_requirements", 0),
+            "offer_id": data.get("offer_id"),
+            "timestamp": datetime.fromtimestamp(os.path.getmtime(file)).strftime("%Y-%m-%d %H:%M:%S")
+        })
             
     # Ordenar por fecha descendente
     results.sort(key=lambda x: x["timestamp"], reverse=True)
     return results
 
 @app.get("/evaluations/{evaluation_id}")
-async def get_evaluation_detail(evaluation_id: str):
-    """Obtener detalles completos para una evaluación específica."""
+async def get_evaluation_detail(evaluation_id: str, transcript_turns: Optional[int] = Query(default=None, ge=1)):
+    """Obtener detalles completos para una evaluación específica (opcionalmente solo los últimos turnos)."""
     paths = get_file_paths(evaluation_id)
     
     if not os.path.exists(paths['eval']):
-        raise HTTPException(status_code=404, detail="Evaluation not found")
+        # Evaluación archivada: se lee solo su registro dentro del segmento
+        bundle = archive_store.read(evaluation_id)
+        if bundle is None:
+            raise HTTPException(status_code=404, detail="Evaluation not found")
+        records = bundle["transcript"]
+        if transcript_turns is not None and records:
+            first_turn = records[-1]["turn"] - transcript_turns + 1
+            records = [r for r in records if r["turn"] >= first_turn]
+        return {
+            "evaluation": bundle["evaluation"],
+            "transcript": render_transcript_text(records) if records else "",
+            "archived": True
+        }
         
-    with open(paths['eval'], "r", encoding="utf-8") as f:
-        eval_data = json.load(f)
+    eval_data = load_json(paths['eval'])
         
-    transcript = ""
-    if os.path.exists(paths['transcript']):
-        with open(paths['transcript'], "r", encoding="utf-8") as f:
-            transcript = f.read()
+    if transcript_turns is not None:
+        records = tail_transcript(evaluation_id, transcript_turns)
+    else:
+        records = read_transcript(evaluation_id)
+    transcript = render_transcript_text(records) if records else ""
             
     return {
         "evaluation": eval_data,
         "transcript": transcript
     }
+
+
+# --- MÓDULO 5: BÚSQUEDA SEMÁNTICA DE CANDIDATOS ---
+
+SEARCH_INDEX_DIM = int(os.getenv("SEARCH_INDEX_DIM", "4096"))
+SEARCH_COMPACT_EVERY = int(os.getenv("SEARCH_COMPACT_EVERY", "500"))
+
+STOPWORDS = {
+    "de", "la", "el", "en", "y", "a", "los", "las", "del", "un", "una", "con", "por", "para",
+    "que", "se", "su", "al", "lo", "como", "mas", "o", "es", "son", "sus", "he", "ha", "años",
+    "anos", "the", "and", "of", "to", "in", "with", "for", "on", "an", "or", "is", "as",
+}
+
+def normalize_text(text: str) -> str:
+    """Pasa el texto a minúsculas y elimina acentos."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+def tokenize(text: str) -> List[str]:
+    """Tokens útiles para el índice (conserva nombres como 'c++', 'c#' o 'node.js')."""
+    tokens = re.findall(r"[a-z0-9][a-z0-9+#]*(?:\.[a-z0-9]+)*", normalize_text(text))
+    return [t for t in tokens if t not in STOPWORDS and (len(t) > 1 or "+" in t or "#" in t)]
+
+def read_cv_text(eval_id: str) -> str:
+    """CV original de una evaluación (vacío en evaluaciones anteriores a su persistencia)."""
+    path = get_file_paths(eval_id)["cv"]
+    if not os.path.exists(path):
+        return ""
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+class CandidateSearchIndex:
+    """
+    Índice vectorial local sobre CV + requisitos cumplidos de cada evaluación.
+    Esquema TF-IDF 'lnc.ltc' con hashing de términos: los documentos se guardan
+    con tf logarítmico normalizado y el IDF se aplica solo a la consulta, de modo
+    que añadir o actualizar un candidato no obliga a recalcular el resto.
+    Los pesos se guardan en un índice invertido (por término, arrays de filas y
+    pesos): una búsqueda solo recorre las listas de los términos de la consulta.
+
+    El índice se persiste en `search/index.npz` más un log de cambios
+    (`search/delta.jsonl`) que se vuelca a la instantánea cada SEARCH_COMPACT_EVERY
+    cambios, así que un reinicio no obliga a releer todos los CV.
+    """
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.posting_rows: Dict[int, np.ndarray] = {}
+        self.posting_weights: Dict[int, np.ndarray] = {}
+        self.doc_terms: List[np.ndarray] = []
+        self.scores = np.zeros(64, dtype=np.float32)
+        self.discarded = np.zeros(64, dtype=bool)
+        self.active = np.zeros(64, dtype=bool)
+        # Documentos por término (= longitud ocupada de cada lista invertida)
+        self.doc_freq = np.zeros(dim, dtype=np.int64)
+        self.ids: List[str] = []
+        self.names: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.delta_count = 0
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    def _paths(self):
+        base = os.path.join(DATA_DIR, "search")
+        return {
+            "dir": base,
+            "snapshot": os.path.join(base, "index.npz"),
+            "delta": os.path.join(base, "delta.jsonl")
+        }
+
+    def _vectorize(self, text: str):
+        """Vector disperso (términos, pesos tf logarítmicos) de un texto."""
+        tokens = tokenize(text)
+        if not tokens:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        buckets = np.fromiter((zlib.crc32(t.encode("utf-8")) % self.dim for t in tokens), dtype=np.int64, count=len(tokens))
+        terms, counts = np.unique(buckets, return_counts=True)
+        return terms, (1.0 + np.log(counts)).astype(np.float32)
+
+    def _index(self, row: int, terms: np.ndarray, weights: np.ndarray):
+        for term, weight in zip(terms.tolist(), weights.tolist()):
+            rows = self.posting_rows.get(term)
+            n = int(self.doc_freq[term])
+            if rows is None or n == rows.size:
+                # Crecimiento amortizado de la lista invertida
+                capacity = max(8, n * 2)
+                new_rows = np.zeros(capacity, dtype=np.int32)
+                new_weights = np.zeros(capacity, dtype=np.float32)
+                if rows is not None:
+                    new_rows[:n] = rows[:n]
+                    new_weights[:n] = self.posting_weights[term][:n]
+                self.posting_rows[term], self.posting_weights[term] = new_rows, new_weights
+            self.posting_rows[term][n] = row
+            self.posting_weights[term][n] = weight
+            self.doc_freq[term] = n + 1
+        self.doc_terms[row] = terms.astype(np.int32)
+
+    def _unindex(self, row: int):
+        for term in self.doc_terms[row].tolist():
+            n = int(self.doc_freq[term])
+            rows, weights = self.posting_rows[term], self.posting_weights[term]
+            # El hueco se rellena con la última entrada (el orden de la lista no importa)
+            i = int(np.flatnonzero(rows[:n] == row)[0])
+            rows[i], weights[i] = rows[n - 1], weights[n - 1]
+            self.doc_freq[term] = n - 1
+        self.doc_terms[row] = np.zeros(0, dtype=np.int32)
+
+    def _grow(self):
+        capacity = self.scores.shape[0] * 2
+        for name in ("scores", "discarded", "active"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:old.shape[0]] = old
+            setattr(self, name, new)
+
+    def ensure_loaded(self):
+        """Carga la instantánea y el log de cambios; la primera vez, lo construye desde disco."""
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            paths = self._paths()
+            os.makedirs(paths["dir"], exist_ok=True)
+            if os.path.exists(paths["snapshot"]):
+                self._load_snapshot(paths["snapshot"])
+                if os.path.exists(paths["delta"]):
+                    # Una última línea incompleta tras una caída se descarta antes de seguir escribiendo
+                    truncate_torn_tail(paths["delta"])
+                    with open(paths["delta"], "r", encoding="utf-8") as f:
+                        for line in f:
+                            op = json.loads(line)
+                            if op["op"] == "upsert":
+                                self._apply_upsert(op["id"], np.array(op["terms"], dtype=np.int64), np.array(op["weights"], dtype=np.float32), op["score"], op["discarded"], op["name"])
+                            else:
+                                self._apply_remove(op["id"])
+                            self.delta_count += 1
+                self._loaded = True
+                return
+
+            evaluations = {eval_id: data for eval_id, data, _ in iter_live_evaluations()}
+            # Las evaluaciones sustituidas por un reenvío de CV no se indexan
+            superseded = {data.get("previous_evaluation_id") for data in evaluations.values()}
+            for eval_id, data in evaluations.items():
+                if eval_id not in superseded:
+                    terms, weights = self._document_vector(data, read_cv_text(eval_id))
+                    self._apply_upsert(eval_id, terms, weights, data.get("score", 0) or 0, bool(data.get("discarded", False)), data.get("candidate_name", "Unknown"))
+            self._compact()
+            self._loaded = True
+
+    def _load_snapshot(self, path: str):
+        with np.load(path) as snapshot:
+            meta = json.loads(snapshot["meta"].tobytes().decode("utf-8"))
+            term_offsets = snapshot["term_offsets"]
+            posting_rows, posting_weights = snapshot["posting_rows"], snapshot["posting_weights"]
+            doc_offsets, doc_terms = snapshot["doc_offsets"], snapshot["doc_terms"]
+            size = len(meta["ids"])
+            capacity = max(64, size)
+            for name in ("scores", "discarded", "active"):
+                array = np.zeros(capacity, dtype=getattr(self, name).dtype)
+                array[:size] = snapshot[name]
+                setattr(self, name, array)
+        self.ids, self.names = meta["ids"], meta["names"]
+        self.doc_freq = np.diff(term_offsets).astype(np.int64)
+        for term in np.flatnonzero(self.doc_freq).tolist():
+            start, end = int(term_offsets[term]), int(term_offsets[term + 1])
+            self.posting_rows[term] = posting_rows[start:end].copy()
+            self.posting_weights[term] = posting_weights[start:end].copy()
+        self.doc_terms = [doc_terms[doc_offsets[i]:doc_offsets[i + 1]] for i in range(size)]
+        self.rows = {eval_id: row for row, eval_id in enumerate(self.ids) if self.active[row]}
+
+    def _compact(self):
+        """Escribe la instantánea (fichero temporal + rename) y vacía el log de cambios."""
+        paths = self._paths()
+        size = len(self.ids)
+        terms = np.flatnonzero(self.doc_freq).tolist()
+        term_offsets = np.zeros(self.dim + 1, dtype=np.int64)
+        term_offsets[1:] = np.cumsum(self.doc_freq)
+        doc_lengths = np.array([t.size for t in self.doc_terms], dtype=np.int64)
+        doc_offsets = np.zeros(size + 1, dtype=np.int64)
+        doc_offsets[1:] = np.cumsum(doc_lengths)
+        meta = json.dumps({"ids": self.ids, "names": self.names}, ensure_ascii=False).encode("utf-8")
+        tmp_path = f"{paths['snapshot']}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                meta=np.frombuffer(meta, dtype=np.uint8),
+                term_offsets=term_offsets,
+                posting_rows=np.concatenate([self.posting_rows[t][:self.doc_freq[t]] for t in terms] or [np.zeros(0, dtype=np.int32)]),
+                posting_weights=np.concatenate([self.posting_weights[t][:self.doc_freq[t]] for t in terms] or [np.zeros(0, dtype=np.float32)]),
+                doc_offsets=doc_offsets,
+                doc_terms=np.concatenate(self.doc_terms or [np.zeros(0, dtype=np.int32)]).astype(np.int32),
+                scores=self.scores[:size],
+                discarded=self.discarded[:size],
+                active=self.active[:size]
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, paths["snapshot"])
+        with open(paths["delta"], "w", encoding="utf-8"):
+            pass
+        self.delta_count = 0
+
+    def _log(self, op: dict):
+        with open(self._paths()["delta"], "a", encoding="utf-8") as f:
+            f.write(json.dumps(op, ensure_ascii=False) + "\n")
+        self.delta_count += 1
+        if self.delta_count >= SEARCH_COMPACT_EVERY:
+            self._compact()
+
+    def _document_vector(self, eval_data: dict, cv_text: str):
+        doc_text = cv_text + "\n" + "\n".join(eval_data.get("matching_requirements", []))
+        terms, weights = self._vectorize(doc_text)
+        norm = np.linalg.norm(weights)
+        if norm > 0:
+            weights /= norm
+        return terms, weights
+
+    def _apply_upsert(self, eval_id: str, terms: np.ndarray, weights: np.ndarray, score: float, discarded: bool, name: str):
+        row = self.rows.get(eval_id)
+        if row is None:
+            row = len(self.ids)
+            if row >= self.scores.shape[0]:
+                self._grow()
+            self.ids.append(eval_id)
+            self.names.append("")
+            self.doc_terms.append(np.zeros(0, dtype=np.int32))
+            self.rows[eval_id] = row
+        else:
+            self._unindex(row)
+        self._index(row, terms, weights)
+        self.scores[row] = score
+        self.discarded[row] = discarded
+        self.active[row] = True
+        self.names[row] = name
+
+    def _apply_remove(self, eval_id: str):
+        row = self.rows.pop(eval_id, None)
+        if row is None:
+            return
+        self._unindex(row)
+        self.active[row] = False
+
+    def upsert(self, eval_id: str, eval_data: dict, cv_text: str):
+        """Inserta o actualiza incrementalmente el vector de una evaluación."""
+        self.ensure_loaded()
+        terms, weights = self._document_vector(eval_data, cv_text)
+        score = eval_data.get("score", 0) or 0
+        discarded = bool(eval_data.get("discarded", False))
+        name = eval_data.get("candidate_name", "Unknown")
+        with self._lock:
+            self._apply_upsert(eval_id, terms, weights, score, discarded, name)
+            self._log({
+                "op": "upsert", "id": eval_id, "terms": terms.tolist(), "weights": weights.tolist(),
+                "score": score, "discarded": discarded, "name": name
+            })
+
+    def remove(self, eval_id: str):
+        """Retira una evaluación del índice (su fila queda inactiva)."""
+        self.ensure_loaded()
+        with self._lock:
+            if eval_id not in self.rows:
+                return
+            self._apply_remove(eval_id)
+            self._log({"op": "remove", "id": eval_id})
+
+    def search(self, query: str, top_k: int, discarded: Optional[bool] = None, min_score: Optional[float] = None) -> List[dict]:
+        self.ensure_loaded()
+        with self._lock:
+            size = len(self.ids)
+            mask = self.active[:size].copy()
+            n_docs = int(mask.sum())
+            terms, weights = self._vectorize(query)
+            if n_docs == 0 or terms.size == 0:
+                return []
+            weights *= np.log((1.0 + n_docs) / (1.0 + self.doc_freq[terms])) + 1.0
+            weights /= np.linalg.norm(weights)
+
+            if discarded is not None:
+                mask &= self.discarded[:size] == discarded
+            if min_score is not None:
+                mask &= self.scores[:size] >= min_score
+
+            # Acumulación sobre las listas invertidas de los términos de la consulta
+            sims = np.zeros(size, dtype=np.float32)
+            for term, weight in zip(terms.tolist(), weights.tolist()):
+                n = int(self.doc_freq[term])
+                if n:
+                    sims[self.posting_rows[term][:n]] += weight * self.posting_weights[term][:n]
+            sims[~mask] = 0
+            candidates = np.flatnonzero(sims > 0)
+            sims = sims[candidates]
+            if candidates.size == 0:
+                return []
+            k = min(top_k, candidates.size)
+            top = np.argpartition(-sims, k - 1)[:k]
+            top = top[np.argsort(-sims[top])]
+            return [
+                {
+                    "id": self.ids[candidates[i]],
+                    "candidate_name": self.names[candidates[i]],
+                    "score": round(float(self.scores[candidates[i]]), 1),
+                    "discarded": bool(self.discarded[candidates[i]]),
+                    "similarity": round(float(sims[i]), 4)
+                }
+                for i in top
+            ]
+
+search_index = CandidateSearchIndex(SEARCH_INDEX_DIM)
+
+class CandidateSearchRequest(BaseModel):
+    offer_text: str
+    top_k: int = Field(default=10, ge=1, le=100)
+    discarded: Optional[bool] = None
+    min_score: Optional[float] = None
+
+@app.on_event("startup")
+def warm_search_index():
+    # El índice se carga en segundo plano al arrancar, no en la primera búsqueda
+    threading.Thread(target=search_index.ensure_loaded, daemon=True).start()
+
+# Síncrono: mientras el índice termina de cargarse, la espera ocurre en el pool de hilos
+@app.post("/search/candidates")
+def search_candidates(request: CandidateSearchRequest):
+    """Candidatos históricos más afines a una oferta, sin llamadas al LLM."""
+    start = time.perf_counter()
+    results = search_index.search(request.offer_text, request.top_k, request.discarded, request.min_score)
+    return {
+        "took_ms": round((time.perf_counter() - start) * 1000, 2),
+        "results": results
+    }
+
+
+# --- MÓDULO 6: OFERTAS Y RANKINGS POR OFERTA ---
+
+LEADERBOARD_SIZE = int(os.getenv("LEADERBOARD_SIZE", "50"))
+SCORE_BINS = 10
+
+def get_offer_path(offer_id: str) -> str:
+    return os.path.join(DATA_DIR, "offers", f"offer_{offer_id}.json")
+
+def offer_text_hash(offer_text: str) -> str:
+    """Huella del texto de la oferta, insensible a mayúsculas, acentos y espacios."""
+    canonical = " ".join(normalize_text(offer_text).split())
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def score_bin(score: float) -> int:
+    return min(max(int((score or 0) // (100 / SCORE_BINS)), 0), SCORE_BINS - 1)
+
+def write_json_atomic(path: str, data: dict):
+    """Escribe un JSON mediante fichero temporal + rename para no dejarlo a medias."""
+    tmp_path = f"{path}.tmp"
+    save_json(tmp_path, data)
+    os.replace(tmp_path, path)
+
+def ranking_entry(eval_id: str, data: dict) -> list:
+    return [data.get("score", 0) or 0, eval_id, data.get("candidate_name", "Unknown"), bool(data.get("discarded", False))]
+
+def ranking_remove(ranking: list, eval_id: str, score: float):
+    """Quita la entrada de una evaluación del ranking, localizándola por bisección."""
+    i = bisect.bisect_left(ranking, [score, eval_id])
+    if i < len(ranking) and ranking[i][1] == eval_id:
+        del ranking[i]
+        return
+    # Score desconocido o desactualizado: búsqueda lineal
+    for i, entry in enumerate(ranking):
+        if entry[1] == eval_id:
+            del ranking[i]
+            return
+
+class OfferStore:
+    """
+    Ofertas persistidas en `offers/offer_{id}.json` con agregados mantenidos
+    incrementalmente en cada escritura: nº de candidatos, descartes, histograma
+    de scores y el ranking de candidatos vigentes, una lista ordenada por
+    (score, evaluation_id) que se actualiza por bisección, de modo que leer el
+    top-k no recorre evaluaciones.
+    """
+
+    def __init__(self):
+        self.offers: Dict[str, dict] = {}
+        self.by_hash: Dict[str, str] = {}
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    def ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            os.makedirs(os.path.join(DATA_DIR, "offers"), exist_ok=True)
+            for file in glob(os.path.join(DATA_DIR, "offers", "offer_*.json")):
+                try:
+                    with open(file, "r", encoding="utf-8") as f:
+                        offer = json.load(f)
+                except Exception:
+                    continue
+                self.offers[offer["offer_id"]] = offer
+                self.by_hash[offer["text_hash"]] = offer["offer_id"]
+            legacy = [o for o in self.offers.values() if "ranking" not in o]
+            if legacy:
+                self._migrate_rankings(legacy)
+            self._loaded = True
+
+    def _migrate_rankings(self, offers: List[dict]):
+        """Ofertas guardadas con el antiguo top-N en heap: ranking completo, una sola vez."""
+        evaluations = {oid: {} for oid in (o["offer_id"] for o in offers)}
+        for eval_id, data, _ in iter_live_evaluations():
+            if data.get("offer_id") in evaluations:
+                evaluations[data["offer_id"]][eval_id] = data
+        for offer_id in evaluations:
+            for eval_id in archive_store.ids_for_offer(offer_id):
+                bundle = archive_store.read(eval_id)
+                if bundle is not None:
+                    evaluations[offer_id][eval_id] = bundle["evaluation"]
+        for offer in offers:
+            candidates = evaluations[offer["offer_id"]]
+            superseded = {data.get("previous_evaluation_id") for data in candidates.values()}
+            offer["ranking"] = sorted(
+                ranking_entry(eval_id, data) for eval_id, data in candidates.items() if eval_id not in superseded
+            )
+            offer.pop("top_heap", None)
+            offer.pop("top_heap_stale", None)
+            self._save(offer)
+
+    def _save(self, offer: dict):
+        write_json_atomic(get_offer_path(offer["offer_id"]), offer)
+
+    def set_requirements(self, offer_id: str, requirements: List[dict]):
+        """Cachea la descomposición de la oferta en requisitos atómicos."""
+        with self._lock:
+            offer = self.get(offer_id)
+            offer["requirements"] = requirements
+            self._save(offer)
+
+    def get(self, offer_id: str) -> dict:
+        self.ensure_loaded()
+        offer = self.offers.get(offer_id)
+        if offer is None:
+            raise HTTPException(status_code=404, detail="Offer not found")
+        return offer
+
+    def create(self, offer_text: str, title: Optional[str] = None) -> dict:
+        """Registra una oferta; si ya existe una con el mismo texto se reutiliza."""
+        self.ensure_loaded()
+        text_hash = offer_text_hash(offer_text)
+        with self._lock:
+            if text_hash in self.by_hash:
+                return self.offers[self.by_hash[text_hash]]
+            first_line = next((line.strip() for line in offer_text.splitlines() if line.strip()), "Oferta")
+            offer = {
+                "offer_id": str(uuid.uuid4()),
+                "title": title or first_line[:80],
+                "offer_text": offer_text,
+                "text_hash": text_hash,
+                "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "stats": {
+                    "candidate_count": 0,
+                    "discarded_count": 0,
+                    "score_sum": 0.0,
+                    "score_histogram": [0] * SCORE_BINS
+                },
+                # Lista ascendente de [score, evaluation_id, candidate_name, discarded]
+                "ranking": []
+            }
+            self.offers[offer["offer_id"]] = offer
+            self.by_hash[text_hash] = offer["offer_id"]
+            self._save(offer)
+            return offer
+
+    def resolve(self, offer_id: Optional[str], offer_text: Optional[str]) -> dict:
+        if offer_id:
+            return self.get(offer_id)
+        if not offer_text:
+            raise HTTPException(status_code=422, detail="offer_id or offer_text is required")
+        return self.create(offer_text)
+
+    def record_evaluation(self, offer_id: str, eval_id: str, old_data: Optional[dict], new_data: dict, replaces: Optional[str] = None):
+        """
+        Actualiza los agregados de la oferta con el alta o cambio de una evaluación.
+        `replaces` indica la evaluación previa a la que sustituye (reenvío de CV).
+        """
+        self.ensure_loaded()
+        with self._lock:
+            offer = self.offers.get(offer_id)
+            if offer is None:
+                return
+            stats = offer["stats"]
+
+            # Retirar la contribución anterior (p.ej. score inicial antes de la auditoría)
+            if old_data is None:
+                stats["candidate_count"] += 1
+            else:
+                stats["discarded_count"] -= int(bool(old_data.get("discarded", False)))
+                stats["score_sum"] -= old_data.get("score", 0) or 0
+                stats["score_histogram"][score_bin(old_data.get("score", 0))] -= 1
+
+            score = new_data.get("score", 0) or 0
+            stats["discarded_count"] += int(bool(new_data.get("discarded", False)))
+            stats["score_sum"] += score
+            stats["score_histogram"][score_bin(score)] += 1
+
+            # Mantener el ranking: se retira la entrada anterior y se inserta la nueva
+            if old_data is not None:
+                ranking_remove(offer["ranking"], replaces or eval_id, old_data.get("score", 0) or 0)
+            bisect.insort(offer["ranking"], ranking_entry(eval_id, new_data))
+
+            self._save(offer)
+
+    def remove_evaluation(self, offer_id: str, eval_id: str, data: dict):
+        """Retira una evaluación de los agregados de la oferta (borrado por política)."""
+        self.ensure_loaded()
+        with self._lock:
+            offer = self.offers.get(offer_id)
+            if offer is None:
+                return
+            stats = offer["stats"]
+            stats["candidate_count"] -= 1
+            stats["discarded_count"] -= int(bool(data.get("discarded", False)))
+            stats["score_sum"] -= data.get("score", 0) or 0
+            stats["score_histogram"][score_bin(data.get("score", 0))] -= 1
+
+            ranking_remove(offer["ranking"], eval_id, data.get("score", 0) or 0)
+            self._save(offer)
+
+    def leaderboard(self, offer_id: str, limit: int) -> List[dict]:
+        offer = self.get(offer_id)
+        with self._lock:
+            top = offer["ranking"][-limit:][::-1]
+        return [
+            {"evaluation_id": e[1], "candidate_name": e[2], "score": e[0], "discarded": e[3]}
+            for e in top
+        ]
+
+def offer_summary(offer: dict) -> dict:
+    stats = offer["stats"]
+    count = stats["candidate_count"]
+    return {
+        "offer_id": offer["offer_id"],
+        "title": offer["title"],
+        "created_at": offer["created_at"],
+        "candidate_count": count,
+        "discard_rate": round(stats["discarded_count"] / count, 3) if count else 0.0,
+        "mean_score": round(stats["score_sum"] / count, 1) if count else 0.0,
+        "score_histogram": stats["score_histogram"]
+    }
+
+offer_store = OfferStore()
+
+class CreateOfferRequest(BaseModel):
+    offer_text: str
+    title: Optional[str] = None
+
+@app.post("/offers")
+async def create_offer(request: CreateOfferRequest):
+    """Registrar una oferta (idempotente por texto)."""
+    offer = offer_store.create(request.offer_text, request.title)
+    return offer_summary(offer)
+
+@app.get("/offers")
+async def list_offers():
+    """Listar ofertas con sus agregados para agrupar candidatos por puesto."""
+    offer_store.ensure_loaded()
+    offers = [offer_summary(o) for o in offer_store.offers.values()]
+    offers.sort(key=lambda x: x["created_at"], reverse=True)
+    return offers
+
+@app.get("/offers/{offer_id}")
+async def get_offer(offer_id: str):
+    offer = offer_store.get(offer_id)
+    return {**offer_summary(offer), "offer_text": offer["offer_text"]}
+
+@app.get("/offers/{offer_id}/leaderboard")
+async def get_offer_leaderboard(offer_id: str, limit: int = Query(default=10, ge=1, le=LEADERBOARD_SIZE)):
+    """Ranking de candidatos de una oferta, leído del ranking mantenido en cada escritura."""
+    offer = offer_store.get(offer_id)
+    return {
+        **offer_summary(offer),
+        "leaderboard": offer_store.leaderboard(offer_id, limit)
+    }
+
+
+# --- MÓDULO 7: RE-EVALUACIÓN INCREMENTAL DE CV ---
+
+REEVAL_MAX_CHANGE_RATIO = float(os.getenv("REEVAL_MAX_CHANGE_RATIO", "0.5"))
+DISCARD_FLAG_PREFIX = "DESCARTADO POR REQUISITO OBLIGATORIO:"
+
+def normalize_dni(dni: str) -> str:
+    return re.sub(r"[\s.-]", "", dni or "").upper()
+
+class EvaluationHistory:
+    """Índice (DNI, oferta) -> última evaluación, construido una vez desde disco."""
+
+    def __init__(self):
+        self.latest_by_key: Dict[tuple, tuple] = {}
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    def ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            for eval_id, data, file in iter_live_evaluations():
+                if not data.get("dni") or not data.get("offer_id"):
+                    continue
+                created_at = data.get("created_at") or datetime.fromtimestamp(os.path.getmtime(file)).strftime("%Y-%m-%d %H:%M:%S")
+                self._put(data["dni"], data["offer_id"], eval_id, created_at)
+            self._loaded = True
+
+    def _put(self, dni: str, offer_id: str, eval_id: str, created_at: str):
+        key = (normalize_dni(dni), offer_id)
+        current = self.latest_by_key.get(key)
+        if current is None or created_at >= current[1]:
+            self.latest_by_key[key] = (eval_id, created_at)
+
+    def latest(self, dni: str, offer_id: str) -> Optional[str]:
+        self.ensure_loaded()
+        entry = self.latest_by_key.get((normalize_dni(dni), offer_id))
+        if entry is None:
+            # Las evaluaciones archivadas no se cargan desde disco al arrancar
+            return archive_store.latest(dni, offer_id)
+        return entry[0]
+
+    def record(self, dni: str, offer_id: str, eval_id: str):
+        self.ensure_loaded()
+        with self._lock:
+            self._put(dni, offer_id, eval_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+
+    def remove(self, eval_id: str):
+        with self._lock:
+            for key, entry in list(self.latest_by_key.items()):
+                if entry[0] == eval_id:
+                    del self.latest_by_key[key]
+
+evaluation_history = EvaluationHistory()
+
+def diff_cv(old_cv: str, new_cv: str):
+    """Devuelve (texto de las líneas añadidas/eliminadas/modificadas, proporción de cambio)."""
+    old_lines = [line.strip() for line in old_cv.splitlines() if line.strip()]
+    new_lines = [line.strip() for line in new_cv.splitlines() if line.strip()]
+    matcher = difflib.SequenceMatcher(a=old_lines, b=new_lines, autojunk=False)
+    changed = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag != "equal":
+            changed.extend(old_lines[i1:i2])
+            changed.extend(new_lines[j1:j2])
+    return "\n".join(changed), (1.0 - matcher.ratio()) if changed else 0.0
+
+def affected_requirements(requirements: List[str], changed_text: str) -> List[str]:
+    """Requisitos cuya evidencia puede verse afectada por las secciones modificadas."""
+    changed_tokens = set(tokenize(changed_text))
+    affected = []
+    for requirement in requirements:
+        keywords = set(tokenize(requirement))
+        # Sin palabras clave útiles no se puede descartar el impacto: se re-evalúa
+        if not keywords or keywords & changed_tokens:
+            affected.append(requirement)
+    return affected
+
+def discard_flag_requirements(flag: str, requirements: List[str]) -> List[str]:
+    """
+    Requisitos a los que puede referirse una red flag de descarte. El modelo nombra
+    el requisito libremente ("Docker" frente a "Experiencia con Docker (obligatorio)"),
+    así que además de la coincidencia exacta se compara por palabras clave.
+    """
+    name = flag[len(DISCARD_FLAG_PREFIX):].strip()
+    if name in requirements:
+        return [name]
+    flag_tokens = set(tokenize(name))
+    if not flag_tokens:
+        return []
+    tied = []
+    for requirement in requirements:
+        keywords = set(tokenize(requirement))
+        if keywords and (flag_tokens <= keywords or keywords <= flag_tokens):
+            tied.append(requirement)
+    return tied
+
+class RequirementReclassification(BaseModel):
+    matching_requirements: List[str] = Field(description="Requisitos (de la lista dada) que el CV cumple explícitamente.")
+    unmatching_requirements: List[str] = Field(description="Requisitos (de la lista dada) con evidencia clara de NO cumplirse.")
+    not_found_requirements: List[str] = Field(description="Requisitos (de la lista dada) que el CV no menciona.")
+    mandatory_unmatching: List[str] = Field(default=[], description="Subconjunto de unmatching_requirements que son OBLIGATORIOS en la oferta.")
+
+async def incremental_reanalysis(previous_id: str, offer_text: str, cv_text: str) -> Optional[dict]:
+    """
+    Re-clasifica solo los requisitos afectados por el cambio de CV y arrastra el resto.
+    Devuelve None si no hay base comparable o el CV cambió demasiado (análisis completo).
+    """
+    paths = get_file_paths(previous_id)
+    if os.path.exists(paths["eval"]):
+        previous, old_cv = load_json(paths["eval"]), read_cv_text(previous_id)
+    else:
+        bundle = archive_store.read(previous_id)
+        if bundle is None:
+            return None
+        previous, old_cv = bundle["evaluation"], bundle["cv_text"]
+    if not old_cv:
+        return None
+
+    changed_text, change_ratio = diff_cv(old_cv, cv_text)
+    if change_ratio > REEVAL_MAX_CHANGE_RATIO:
+        return None
+
+    previous_status = {}
+    for status in ("matching", "unmatching", "not_found"):
+        for requirement in previous.get(f"{status}_requirements", []):
+            previous_status[requirement] = status
+    affected = affected_requirements(list(previous_status), changed_text) if changed_text else []
+    affected_set = set(affected)
+
+    new_status = {r: s for r, s in previous_status.items() if r not in affected_set}
+    mandatory_unmatching = set()
+
+    if affected:
+        system_prompt = """
+Eres un Experto en Reclutamiento Técnico. El candidato ha actualizado su CV y debes volver a clasificar ÚNICAMENTE los requisitos indicados.
+
+REGLAS CRÍTICAS:
+1. Usa los requisitos EXACTAMENTE como están escritos en la lista y clasifica cada uno en una sola categoría.
+2. Clasificación:
+    - `matching`: Cumple explícitamente.
+    - `unmatching`: Existe EVIDENCIA CLARA Y EXPLICITA de que NO cumple.
+    - `not_found`: SI NO SE MENCIONA, ES `not_found`.
+3. Indica en `mandatory_unmatching` los requisitos `unmatching` que la oferta marca como OBLIGATORIOS.
+"""
+        requirement_list = "\n".join(f"- {r}" for r in affected)
+        messages = [
+            SystemMessage(content=system_prompt),
+            HumanMessage(content=f"OFERTA:\n{offer_text}\n\nCV:\n{cv_text}\n\nREQUISITOS A CLASIFICAR:\n{requirement_list}")
+        ]
+        reclassified = await invoke_structured(messages, RequirementReclassification, PRIORITY_ANALYSIS)
+
+        for status in ("matching", "unmatching", "not_found"):
+            for requirement in reclassified.get(f"{status}_requirements", []):
+                if requirement in affected_set:
+                    new_status[requirement] = status
+        # Requisitos que el modelo no haya devuelto se consideran no encontrados
+        for requirement in affected:
+            new_status.setdefault(requirement, "not_found")
+        mandatory_unmatching = {
+            r for r in reclassified.get("mandatory_unmatching", [])
+            if new_status.get(r) == "unmatching"
+        }
+
+    # Red flags: se conservan las de requisitos no afectados y se añaden los nuevos descartes.
+    # Un descarte solo se retira si se puede atribuir a requisitos re-evaluados.
+    red_flags = []
+    for flag in previous.get("red_flags", []):
+        if flag.startswith(DISCARD_FLAG_PREFIX):
+            tied = discard_flag_requirements(flag, list(previous_status))
+            if tied and all(r in affected_set for r in tied):
+                continue
+        elif any(r.lower() in flag.lower() for r in affected):
+            continue
+        red_flags.append(flag)
+    for requirement in sorted(mandatory_unmatching):
+        red_flags.append(f"{DISCARD_FLAG_PREFIX} {requirement}")
+
+    ordered = list(previous_status)
+    return {
+        "matching_requirements": [r for r in ordered if new_status[r] == "matching"],
+        "unmatching_requirements": [r for r in ordered if new_status[r] == "unmatching"],
+        "not_found_requirements": [r for r in ordered if new_status[r] == "not_found"],
+        "discarded": any(flag.startswith(DISCARD_FLAG_PREFIX) for flag in red_flags) or (bool(previous.get("discarded")) and not affected),
+        "red_flags": red_flags,
+        "previous_evaluation_id": previous_id,
+        "reevaluation_mode": "incremental",
+        "reevaluated_requirements": len(affected),
+        "carried_over_requirements": len(ordered) - len(affected)
+    }
+
+
+# --- MÓDULO 8: MÉTRICAS ---
+
+@app.get("/metrics")
+async def get_metrics():
+    """Métricas operativas del motor."""
+    calls = structured_output_metrics["calls"]
+    return {
+        "structured_output": {
+            **structured_output_metrics,
+            "method": STRUCTURED_OUTPUT_METHOD,
+            "parse_failure_rate": round(structured_output_metrics["parse_failures"] / calls, 4) if calls else 0.0
+        },
+        "llm_scheduler": llm_scheduler.snapshot(),
+        "interview": interview_metrics
+    }
+
+
+# --- MÓDULO 9: ANALÍTICA COLUMNAR ---
+
+ANALYTICS_COMPACT_EVERY = int(os.getenv("ANALYTICS_COMPACT_EVERY", "200"))
+PHASE_RANK = {"analysis": 0, "final": 1}
+
+EVALUATION_COLUMNS = [
+    "evaluation_id", "offer_id", "previous_evaluation_id", "created_at",
+    "initial_score", "final_score", "discarded", "audited", "total_requirements"
+]
+REQUIREMENT_COLUMNS = ["evaluation_id", "offer_id", "phase", "status", "requirement", "requirement_key"]
+
+def analytics_rows(eval_id: str, data: dict, phase: str):
+    """Filas columnar de una evaluación: una en `evaluations` y una por requisito/motivo de descarte."""
+    audited = phase == "final" or bool(data.get("audited_at"))
+    evaluation = {
+        "evaluation_id": eval_id,
+        "offer_id": data.get("offer_id"),
+        "previous_evaluation_id": data.get("previous_evaluation_id"),
+        "created_at": data.get("created_at"),
+        "initial_score": float(data.get("initial_score", data.get("score", 0)) or 0),
+        "final_score": float(data.get("score", 0) or 0) if audited else None,
+        "discarded": bool(data.get("discarded", False)),
+        "audited": audited,
+        "total_requirements": int(data.get("total_requirements", 0) or 0)
+    }
+    requirements = []
+    facts = [(status, r) for status in ("matching", "unmatching", "not_found") for r in data.get(f"{status}_requirements", [])]
+    facts += [
+        ("discard_reason", flag[len(DISCARD_FLAG_PREFIX):].strip())
+        for flag in data.get("red_flags", []) if flag.startswith(DISCARD_FLAG_PREFIX)
+    ]
+    for status, requirement in facts:
+        requirements.append({
+            "evaluation_id": eval_id,
+            "offer_id": data.get("offer_id"),
+            "phase": phase,
+            "status": status,
+            "requirement": requirement,
+            "requirement_key": " ".join(normalize_text(requirement).split())
+        })
+    return evaluation, requirements
+
+class AnalyticsStore:
+    """
+    Instantánea columnar de las evaluaciones en `analytics/*.parquet`.
+    Cada escritura se añade a un log de deltas (`delta.jsonl`) y se aplica en
+    memoria; cada ANALYTICS_COMPACT_EVERY deltas se reescriben los Parquet.
+    """
+
+    def __init__(self):
+        self.evaluations = pd.DataFrame(columns=EVALUATION_COLUMNS)
+        self.requirements = pd.DataFrame(columns=REQUIREMENT_COLUMNS)
+        self.pending: List[dict] = []
+        self.delta_count = 0
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    def _paths(self):
+        base = os.path.join(DATA_DIR, "analytics")
+        return {
+            "dir": base,
+            "evaluations": os.path.join(base, "evaluations.parquet"),
+            "requirements": os.path.join(base, "requirements.parquet"),
+            "delta": os.path.join(base, "delta.jsonl")
+        }
+
+    def ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            paths = self._paths()
+            os.makedirs(paths["dir"], exist_ok=True)
+            if os.path.exists(paths["evaluations"]):
+                self.evaluations = pd.read_parquet(paths["evaluations"])
+                self.requirements = pd.read_parquet(paths["requirements"])
+            if os.path.exists(paths["delta"]):
+                # Una última línea incompleta tras una caída se descarta antes de seguir escribiendo
+                truncate_torn_tail(paths["delta"])
+                with open(paths["delta"], "r", encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            self.pending.append(json.loads(line))
+                            self.delta_count += 1
+            elif not os.path.exists(paths["evaluations"]):
+                # Primera ejecución: instantánea inicial a partir de las evaluaciones existentes
+                for eval_id, data, _ in iter_live_evaluations():
+                    phase = "final" if data.get("audited_at") or data.get("key_points") else "analysis"
+                    evaluation, requirements = analytics_rows(eval_id, data, phase)
+                    self.pending.append({"evaluation": evaluation, "phase": phase, "requirements": requirements})
+                self._loaded = True
+                self._apply_pending()
+                self._compact()
+                return
+            self._loaded = True
+
+    def record(self, eval_id: str, data: dict, phase: str):
+        """Registra (upsert) una evaluación tras el análisis o la auditoría."""
+        self.ensure_loaded()
+        evaluation, requirements = analytics_rows(eval_id, data, phase)
+        delta = {"evaluation": evaluation, "phase": phase, "requirements": requirements}
+        with self._lock:
+            with open(self._paths()["delta"], "a", encoding="utf-8") as f:
+                f.write(json.dumps(delta, ensure_ascii=False) + "\n")
+            self.pending.append(delta)
+            self.delta_count += 1
+            self._maybe_compact()
+
+    def remove(self, eval_id: str):
+        """Elimina una evaluación de la instantánea (borrado por política, p.ej. RGPD)."""
+        self.ensure_loaded()
+        delta = {"deleted": eval_id}
+        with self._lock:
+            with open(self._paths()["delta"], "a", encoding="utf-8") as f:
+                f.write(json.dumps(delta) + "\n")
+            self.pending.append(delta)
+            self.delta_count += 1
+            self._maybe_compact()
+
+    def _apply_pending(self):
+        if not self.pending:
+            return
+        deleted = {d["deleted"] for d in self.pending if "deleted" in d}
+        self.pending = [d for d in self.pending if "evaluation" in d and d["evaluation"]["evaluation_id"] not in deleted]
+        if deleted:
+            self.evaluations = self.evaluations[~self.evaluations["evaluation_id"].isin(deleted)]
+            self.requirements = self.requirements[~self.requirements["evaluation_id"].isin(deleted)]
+        if not self.pending:
+            return
+        evaluations = pd.DataFrame([d["evaluation"] for d in self.pending], columns=EVALUATION_COLUMNS)
+        evaluations = evaluations.drop_duplicates("evaluation_id", keep="last")
+        self.evaluations = pd.concat(
+            [self.evaluations[~self.evaluations["evaluation_id"].isin(evaluations["evaluation_id"])], evaluations],
+            ignore_index=True
+        )
+
+        # Los requisitos se sustituyen por (evaluación, fase)
+        replaced = pd.DataFrame([(d["evaluation"]["evaluation_id"], d["phase"]) for d in self.pending], columns=["evaluation_id", "phase"]).drop_duplicates()
+        latest = {}
+        for d in self.pending:
+            latest[(d["evaluation"]["evaluation_id"], d["phase"])] = d["requirements"]
+        new_rows = pd.DataFrame([row for rows in latest.values() for row in rows], columns=REQUIREMENT_COLUMNS)
+        keys = pd.MultiIndex.from_frame(self.requirements[["evaluation_id", "phase"]])
+        keep = ~keys.isin(pd.MultiIndex.from_frame(replaced))
+        self.requirements = pd.concat([self.requirements[keep], new_rows], ignore_index=True)
+        self.pending = []
+
+    def _maybe_compact(self):
+        # Se compacta también al escribir: sin lecturas de analítica el log no crecería sin límite
+        if self.delta_count >= ANALYTICS_COMPACT_EVERY:
+            self._apply_pending()
+            self._compact()
+
+    def _compact(self):
+        """
+        Reescribe los Parquet (fichero temporal + rename) y solo después vacía el log:
+        si el proceso cae a mitad, quedan la instantánea anterior y el log completo.
+        """
+        paths = self._paths()
+        for name, frame in (("evaluations", self.evaluations), ("requirements", self.requirements)):
+            tmp_path = f"{paths[name]}.tmp"
+            with open(tmp_path, "wb") as f:
+                frame.to_parquet(f, index=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, paths[name])
+        with open(paths["delta"], "w", encoding="utf-8"):
+            pass
+        self.delta_count = 0
+
+    def snapshot(self):
+        """Devuelve (evaluations, requirements) actualizados, sin evaluaciones sustituidas por un reenvío."""
+        self.ensure_loaded()
+        with self._lock:
+            self._apply_pending()
+            self._maybe_compact()
+            evaluations, requirements = self.evaluations, self.requirements
+        superseded = evaluations["previous_evaluation_id"].dropna()
+        evaluations = evaluations[~evaluations["evaluation_id"].isin(superseded)]
+        requirements = requirements[requirements["evaluation_id"].isin(evaluations["evaluation_id"])]
+        return evaluations, requirements
+
+analytics_store = AnalyticsStore()
+
+def analytics_scope(offer_id: Optional[str]):
+    evaluations, requirements = analytics_store.snapshot()
+    if offer_id:
+        evaluations = evaluations[evaluations["offer_id"] == offer_id]
+        requirements = requirements[requirements["offer_id"] == offer_id]
+    return evaluations, requirements
+
+@app.get("/analytics/requirements")
+async def analytics_requirements(
+    status: str = Query(default="not_found", pattern="^(matching|unmatching|not_found|discard_reason)$"),
+    phase: str = Query(default="analysis", pattern="^(analysis|final)$"),
+    offer_id: Optional[str] = None,
+    limit: int = Query(default=20, ge=1, le=200)
+):
+    """Requisitos más frecuentes en un estado (p.ej. los que más a menudo son `not_found` en el CV)."""
+    evaluations, requirements = analytics_scope(offer_id)
+    rows = requirements[(requirements["status"] == status) & (requirements["phase"] == phase)]
+    if rows.empty:
+        return []
+    n_evals = requirements.loc[requirements["phase"] == phase, "evaluation_id"].nunique()
+    counts = (
+        rows.groupby("requirement_key")
+        .agg(requirement=("requirement", "first"), count=("evaluation_id", "nunique"))
+        .sort_values("count", ascending=False)
+        .head(limit)
+    )
+    counts["rate"] = (counts["count"] / max(n_evals, 1)).round(3)
+    return counts[["requirement", "count", "rate"]].to_dict(orient="records")
+
+@app.get("/analytics/scores")
+async def analytics_scores(offer_id: Optional[str] = None, bins: int = Query(default=SCORE_BINS, ge=1, le=100)):
+    """Distribución de scores antes (análisis de CV) y después de la entrevista."""
+    evaluations, _ = analytics_scope(offer_id)
+    edges = np.linspace(0, 100, bins + 1)
+    audited = evaluations[evaluations["audited"].astype(bool)]
+
+    def distribution(values: np.ndarray) -> dict:
+        values = values[~np.isnan(values)]
+        histogram, _ = np.histogram(values, bins=edges)
+        return {
+            "count": int(values.size),
+            "mean": round(float(values.mean()), 1) if values.size else None,
+            "median": round(float(np.median(values)), 1) if values.size else None,
+            "histogram": histogram.tolist()
+        }
+
+    before = evaluations["initial_score"].to_numpy(dtype=float)
+    after = audited["final_score"].to_numpy(dtype=float)
+    delta = after - audited["initial_score"].to_numpy(dtype=float)
+    return {
+        "bin_edges": edges.round(1).tolist(),
+        "before_interview": distribution(before),
+        "after_interview": distribution(after),
+        "mean_interview_delta": round(float(np.nanmean(delta)), 1) if delta.size else None
+    }
+
+@app.get("/analytics/discard-reasons")
+async def analytics_discard_reasons(offer_id: Optional[str] = None, limit: int = Query(default=50, ge=1, le=500)):
+    """Motivos de descarte agrupados por oferta (según el estado más reciente de cada evaluación)."""
+    _, requirements = analytics_scope(offer_id)
+    if requirements.empty:
+        return []
+    rank = requirements["phase"].map(PHASE_RANK)
+    latest = rank == rank.groupby(requirements["evaluation_id"]).transform("max")
+    rows = requirements[latest & (requirements["status"] == "discard_reason")]
+    if rows.empty:
+        return []
+    counts = (
+        rows.groupby(["offer_id", "requirement_key"], dropna=False)
+        .agg(reason=("requirement", "first"), count=("evaluation_id", "nunique"))
+        .reset_index()
+        .sort_values("count", ascending=False)
+        .head(limit)
+    )
+    counts["offer_id"] = counts["offer_id"].astype(object).where(counts["offer_id"].notna(), None)
+    return counts[["offer_id", "reason", "count"]].to_dict(orient="records")
+
+
+# --- MÓDULO 10: TRANSCRIPCIONES (JSONL APPEND-ONLY) ---
+
+# Política de fsync: "always" (cada turno), "interval" (como mucho cada
+# TRANSCRIPT_FSYNC_INTERVAL segundos por fichero) o "never" (lo decide el SO).
+TRANSCRIPT_FSYNC = os.getenv("TRANSCRIPT_FSYNC", "interval").lower()
+TRANSCRIPT_FSYNC_INTERVAL = float(os.getenv("TRANSCRIPT_FSYNC_INTERVAL", "1.0"))
+TRANSCRIPT_HEADER = "--- INICIO ENTREVISTA ---"
+TRANSCRIPT_ROLES = {"candidate": "Candidato", "evaluator": "Evaluador"}
+
+_last_fsync: Dict[str, float] = {}
+
+def _transcript_record(turn: int, role: str, content: str) -> str:
+    return json.dumps({
+        "turn": turn,
+        "role": role,
+        "content": content,
+        "ts": datetime.now().isoformat(timespec="milliseconds")
+    }, ensure_ascii=False) + "\n"
+
+def _write_transcript(path: str, mode: str, payload: str):
+    """Escritura única con buffer y fsync según la política configurada."""
+    with open(path, mode, encoding="utf-8") as f:
+        f.write(payload)
+        if TRANSCRIPT_FSYNC == "never":
+            return
+        now = time.monotonic()
+        if TRANSCRIPT_FSYNC == "always" or now - _last_fsync.get(path, 0.0) >= TRANSCRIPT_FSYNC_INTERVAL:
+            f.flush()
+            os.fsync(f.fileno())
+            _last_fsync[path] = now
+
+def _parse_record(line) -> Optional[dict]:
+    """Registro JSONL, o None si la línea quedó incompleta por una caída."""
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+def _iter_lines_reversed(path: str, block_size: int = 8192):
+    """Recorre las líneas de un fichero desde el final, leyendo solo los bloques necesarios."""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        buffer = b""
+        while position > 0:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            buffer = f.read(read_size) + buffer
+            lines = buffer.split(b"\n")
+            buffer = lines.pop(0)
+            for line in reversed(lines):
+                if line.strip():
+                    yield line
+        if buffer.strip():
+            yield buffer
+
+def _read_legacy_transcript(path: str) -> List[dict]:
+    """Convierte una transcripción antigua en texto plano ("Candidato: ...") a registros."""
+    records = []
+    turn = 0
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if line.startswith("Candidato: "):
+                turn += 1
+                records.append({"turn": turn, "role": "candidate", "content": line[len("Candidato: "):], "ts": None})
+            elif line.startswith("Evaluador: "):
+                records.append({"turn": turn, "role": "evaluator", "content": line[len("Evaluador: "):], "ts": None})
+            elif records and line != TRANSCRIPT_HEADER:
+                records[-1]["content"] += "\n" + line
+    return records
+
+def migrate_legacy_transcript(eval_id: str):
+    """
+    Convierte la transcripción en texto plano a JSONL antes de seguir escribiendo,
+    para que una entrevista iniciada antes del cambio no pierda sus primeros turnos.
+    Si ya existe un JSONL con turnos nuevos, se añaden a continuación de los antiguos.
+    """
+    paths = get_file_paths(eval_id)
+    if not os.path.exists(paths["transcript_legacy"]):
+        return
+    records = _read_legacy_transcript(paths["transcript_legacy"])
+    if os.path.exists(paths["transcript"]):
+        offset = records[-1]["turn"] + 1 if records else 0
+        with open(paths["transcript"], "r", encoding="utf-8") as f:
+            for line in f:
+                record = _parse_record(line) if line.strip() else None
+                if record is not None:
+                    record["turn"] += offset
+                    records.append(record)
+    tmp_path = f"{paths['transcript']}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, paths["transcript"])
+    os.remove(paths["transcript_legacy"])
+
+def transcript_exists(eval_id: str) -> bool:
+    paths = get_file_paths(eval_id)
+    return os.path.exists(paths["transcript"]) or os.path.exists(paths["transcript_legacy"])
+
+def start_transcript(eval_id: str, evaluator_message: str):
+    """Inicia (o reinicia) la transcripción con el saludo del evaluador como turno 0."""
+    paths = get_file_paths(eval_id)
+    _write_transcript(paths["transcript"], "w", _transcript_record(0, "evaluator", evaluator_message))
+    if os.path.exists(paths["transcript_legacy"]):
+        os.remove(paths["transcript_legacy"])
+
+def last_transcript_turn(eval_id: str) -> int:
+    path = get_file_paths(eval_id)["transcript"]
+    if not os.path.exists(path):
+        return -1
+    for line in _iter_lines_reversed(path):
+        record = _parse_record(line)
+        if record is not None:
+            return record["turn"]
+    return -1
+
+def append_transcript_turn(eval_id: str, candidate_message: str, evaluator_message: str):
+    """Añade un turno completo (candidato + evaluador) con una sola escritura."""
+    migrate_legacy_transcript(eval_id)
+    truncate_torn_tail(get_file_paths(eval_id)["transcript"])
+    turn = last_transcript_turn(eval_id) + 1
+    payload = _transcript_record(turn, "candidate", candidate_message) + _transcript_record(turn, "evaluator", evaluator_message)
+    _write_transcript(get_file_paths(eval_id)["transcript"], "a", payload)
+
+@timed_phase("disk")
+def read_transcript(eval_id: str) -> List[dict]:
+    paths = get_file_paths(eval_id)
+    if os.path.exists(paths["transcript"]):
+        migrate_legacy_transcript(eval_id)
+        with open(paths["transcript"], "r", encoding="utf-8") as f:
+            records = [_parse_record(line) for line in f if line.strip()]
+        return [r for r in records if r is not None]
+    if os.path.exists(paths["transcript_legacy"]):
+        return _read_legacy_transcript(paths["transcript_legacy"])
+    return []
+
+def tail_transcript(eval_id: str, turns: int) -> List[dict]:
+    """Registros de los últimos `turns` turnos, leyendo el fichero desde el final."""
+    path = get_file_paths(eval_id)["transcript"]
+    if os.path.exists(path):
+        migrate_legacy_transcript(eval_id)
+    else:
+        records = read_transcript(eval_id)
+        if not records:
+            return []
+        first_turn = records[-1]["turn"] - turns + 1
+        return [r for r in records if r["turn"] >= first_turn]
+
+    records = []
+    first_turn = None
+    for line in _iter_lines_reversed(path):
+        record = _parse_record(line)
+        if record is None:
+            continue
+        if first_turn is None:
+            first_turn = record["turn"] - turns + 1
+        if record["turn"] < first_turn:
+            break
+        records.append(record)
+    records.reverse()
+    return records
+
+def range_transcript(eval_id: str, start: int, end: int) -> List[dict]:
+    """Registros de los turnos [start, end]; la lectura se detiene al superar `end`."""
+    path = get_file_paths(eval_id)["transcript"]
+    if os.path.exists(path):
+        migrate_legacy_transcript(eval_id)
+    else:
+        return [r for r in read_transcript(eval_id) if start <= r["turn"] <= end]
+
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            record = _parse_record(line) if line.strip() else None
+            if record is None:
+                continue
+            if record["turn"] > end:
+                break
+            if record["turn"] >= start:
+                records.append(record)
+    return records
+
+def render_transcript_text(records: List[dict]) -> str:
+    """Formato de texto plano usado por el panel y el prompt de auditoría."""
+    lines = [TRANSCRIPT_HEADER]
+    for record in records:
+        lines.append(f"{TRANSCRIPT_ROLES.get(record['role'], record['role'])}: {record['content']}")
+    return "\n".join(lines) + "\n"
+
+@app.get("/evaluations/{evaluation_id}/transcript/tail")
+async def get_transcript_tail(evaluation_id: str, turns: int = Query(default=5, ge=1)):
+    """Últimos N turnos de la entrevista."""
+    if not transcript_exists(evaluation_id):
+        raise HTTPException(status_code=404, detail="Transcript not found")
+    return tail_transcript(evaluation_id, turns)
+
+@app.get("/evaluations/{evaluation_id}/transcript/range")
+async def get_transcript_range(evaluation_id: str, start: int = Query(default=0, ge=0), end: int = Query(..., ge=0)):
+    """Turnos de la entrevista entre `start` y `end` (ambos incluidos)."""
+    if not transcript_exists(evaluation_id):
+        raise HTTPException(status_code=404, detail="Transcript not found")
+    if end < start:
+        raise HTTPException(status_code=422, detail="end must be greater than or equal to start")
+    return range_transcript(evaluation_id, start, end)
+
+
+# --- MÓDULO 11: PERFILADO BAJO DEMANDA ---
+
+# Se activa por petición con la cabecera `X-Profile: <ADMIN_TOKEN>` o
+# por muestreo con PROFILING_SAMPLE_RATE (0-1). Los perfiles se guardan en
+# formato "folded" (compatible con flamegraph.pl / speedscope).
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+PROFILING_INTERVAL_MS = float(os.getenv("PROFILING_INTERVAL_MS", "5"))
+
+def get_diagnostics_dir() -> str:
+    return os.getenv("DIAGNOSTICS_DIR") or os.path.join(DATA_DIR, "diagnostics")
+
+class SamplingProfiler:
+    """
+    Perfilador por muestreo: un hilo auxiliar captura periódicamente la pila del
+    hilo del event loop. Como el loop es compartido, las muestras pueden incluir
+    trabajo de otras peticiones concurrentes.
+    """
+
+    def __init__(self, thread_id: int, interval_ms: float):
+        self.thread_id = thread_id
+        self.interval = interval_ms / 1000
+        self.stacks: Dict[str, int] = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            key = ";".join(reversed(stack))
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def save(self, request: Request, timings: Dict[str, float]) -> str:
+        """Guarda el perfil (.folded) y sus metadatos (.json); devuelve el ID del perfil."""
+        directory = get_diagnostics_dir()
+        os.makedirs(directory, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", request.url.path).strip("_") or "root"
+        profile_id = f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{request.method}_{slug}"
+        with open(os.path.join(directory, f"{profile_id}.folded"), "w", encoding="utf-8") as f:
+            for stack, count in sorted(self.stacks.items(), key=lambda x: -x[1]):
+                f.write(f"{stack} {count}\n")
+        with open(os.path.join(directory, f"{profile_id}.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "method": request.method,
+                "path": request.url.path,
+                "samples": self.samples,
+                "interval_ms": self.interval * 1000,
+                "timings_ms": {k: round(v, 2) for k, v in timings.items()}
+            }, f, indent=4)
+        return profile_id
+
+def should_profile(request: Request) -> bool:
+    if is_admin(request, "x-profile"):
+        return True
+    return PROFILING_SAMPLE_RATE > 0 and random.random() < PROFILING_SAMPLE_RATE
+
+def format_server_timing(timings: Dict[str, float]) -> str:
+    return ", ".join(f"{name};dur={duration:.1f}" for name, duration in timings.items())
+
+@app.middleware("http")
+async def request_diagnostics(request: Request, call_next):
+    """Tiempos por fase en `Server-Timing` y, si procede, perfil de la petición."""
+    timings: Dict[str, float] = {}
+    token = request_timings.set(timings)
+    profiler = None
+    if should_profile(request):
+        profiler = SamplingProfiler(threading.get_ident(), PROFILING_INTERVAL_MS)
+        profiler.start()
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        if profiler is not None:
+            profiler.stop()
+        request_timings.reset(token)
+    timings["total"] = (time.perf_counter() - start) * 1000
+
+    response.headers["Server-Timing"] = format_server_timing(timings)
+    if profiler is not None:
+        response.headers["X-Profile-Id"] = profiler.save(request, timings)
+    return response
+
+
+# --- MÓDULO 12: MATCHING INVERSO (UN CV CONTRA VARIAS OFERTAS) ---
+
+MATCH_BATCH_SIZE = int(os.getenv("MATCH_BATCH_SIZE", "40"))
+
+class OfferRequirement(BaseModel):
+    name: str = Field(description="Requisito atómico (una sola tecnología, herramienta o competencia).")
+    mandatory: bool = Field(description="True si la oferta lo marca como OBLIGATORIO o mínimo.")
+
+class OfferDecomposition(BaseModel):
+    requirements: List[OfferRequirement] = Field(description="Requisitos individuales de la oferta.")
+
+class RequirementVerdict(BaseModel):
+    id: int = Field(description="Número del requisito en la lista recibida.")
+    status: Literal["matching", "unmatching", "not_found"] = Field(description="Clasificación del requisito frente al CV.")
+
+class BatchClassification(BaseModel):
+    verdicts: List[RequirementVerdict] = Field(description="Una clasificación por requisito de la lista.")
+
+def requirement_key(name: str) -> str:
+    return " ".join(normalize_text(name).split())
+
+async def offer_requirements(offer: dict) -> List[dict]:
+    """Requisitos atómicos de la oferta, calculados una sola vez y cacheados en la entidad."""
+    if offer.get("requirements"):
+        return offer["requirements"]
+    system_prompt = """
+Eres un Experto en Reclutamiento Técnico. Separa la oferta en requisitos individuales
+(los requisitos compuestos, p.ej. "FastAPI y LangChain", cuentan como dos) e indica si cada uno es OBLIGATORIO.
+"""
+    messages = [SystemMessage(content=system_prompt), HumanMessage(content=f"OFERTA:\n{offer['offer_text']}")]
+    decomposition = await invoke_structured(messages, OfferDecomposition, PRIORITY_ANALYSIS)
+    requirements = [
+        {"name": r["name"].strip(), "mandatory": r["mandatory"]}
+        for r in decomposition["requirements"] if r["name"].strip()
+    ]
+    offer_store.set_requirements(offer["offer_id"], requirements)
+    return requirements
+
+async def classify_requirement_batch(cv_text: str, names: List[str]) -> Dict[int, str]:
+    system_prompt = """
+Eres un Experto en Reclutamiento Técnico (Motor de Análisis Core). Clasifica cada requisito de la lista frente al CV:
+    - `matching`: Cumple explícitamente.
+    - `unmatching`: Existe EVIDENCIA CLARA Y EXPLICITA de que NO cumple.
+    - `not_found`: SI NO SE MENCIONA, ES `not_found`.
+Devuelve una clasificación por cada número de la lista.
+"""
+    requirement_list = "\n".join(f"{i}. {name}" for i, name in enumerate(names))
+    messages = [
+        SystemMessage(content=system_prompt),
+        HumanMessage(content=f"CV:\n{cv_text}\n\nREQUISITOS:\n{requirement_list}")
+    ]
+    batch = await invoke_structured(messages, BatchClassification, PRIORITY_ANALYSIS)
+    return {v["id"]: v["status"] for v in batch["verdicts"] if 0 <= v["id"] < len(names)}
+
+class MatchOffersRequest(BaseModel):
+    cv_text: str
+    first_name: str
+    last_name: str
+    dni: str
+    offer_ids: List[str] = []
+    offer_texts: List[str] = []
+    persist: bool = False
+
+@app.post("/match/offers")
+async def match_cv_against_offers(request: MatchOffersRequest):
+    """
+    Evalúa un CV contra varias ofertas (todas las registradas si no se indica ninguna).
+    Los requisitos comunes se clasifican una sola vez, en llamadas por lotes.
+    """
+    offer_store.ensure_loaded()
+    offers = [offer_store.get(offer_id) for offer_id in request.offer_ids]
+    offers += [offer_store.create(text) for text in request.offer_texts]
+    if not request.offer_ids and not request.offer_texts:
+        offers = list(offer_store.offers.values())
+    offers = list({o["offer_id"]: o for o in offers}.values())
+    if not offers:
+        raise HTTPException(status_code=404, detail="No offers to match against")
+
+    try:
+        decompositions = await asyncio.gather(*(offer_requirements(o) for o in offers))
+
+        # Conjunto combinado y deduplicado de requisitos
+        unique_names: Dict[str, str] = {}
+        for requirements in decompositions:
+            for requirement in requirements:
+                unique_names.setdefault(requirement_key(requirement["name"]), requirement["name"])
+        keys = list(unique_names)
+
+        batches = [keys[i:i + MATCH_BATCH_SIZE] for i in range(0, len(keys), MATCH_BATCH_SIZE)]
+        batch_results = await asyncio.gather(*(
+            classify_requirement_batch(request.cv_text, [unique_names[k] for k in batch]) for batch in batches
+        ))
+        status_by_key = {}
+        for batch, verdicts in zip(batches, batch_results):
+            for i, key in enumerate(batch):
+                status_by_key[key] = verdicts.get(i, "not_found")
+
+        full_name = f"{request.first_name} {request.last_name}"
+        results = []
+        for offer, requirements in zip(offers, decompositions):
+            result = {
+                "candidate_name": full_name,
+                "dni": request.dni,
+                "matching_requirements": [],
+                "unmatching_requirements": [],
+                "not_found_requirements": [],
+                "red_flags": [],
+                "discarded": False
+            }
+            for requirement in requirements:
+                status = status_by_key[requirement_key(requirement["name"])]
+                result[f"{status}_requirements"].append(requirement["name"])
+                if status == "unmatching" and requirement["mandatory"]:
+                    result["discarded"] = True
+                    result["red_flags"].append(f"{DISCARD_FLAG_PREFIX} {requirement['name']}")
+            recalculate_score(result)
+            result = AnalysisResult.model_validate(result).model_dump()
+            result["offer_id"] = offer["offer_id"]
+
+            if request.persist:
+                previous_id = evaluation_history.latest(request.dni, offer["offer_id"])
+                if previous_id:
+                    result["previous_evaluation_id"] = previous_id
+                result["created_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                result["initial_score"] = result["score"]
+                result["evaluation_id"] = store_new_evaluation(dict(result), request.cv_text, previous_id)
+
+            results.append({"offer_id": offer["offer_id"], "title": offer["title"], "analysis": result})
+
+        results.sort(key=lambda r: r["analysis"]["score"], reverse=True)
+        return {
+            "candidate_name": full_name,
+            "dni": request.dni,
+            "offers": len(offers),
+            "total_requirements": sum(len(r) for r in decompositions),
+            "unique_requirements": len(keys),
+            "classification_batches": len(batches),
+            "results": results
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# --- MÓDULO 13: RETENCIÓN, ARCHIVADO Y COMPACTACIÓN ---
+
+# Las evaluaciones con más de RETENTION_MAX_AGE_DAYS se mueven a segmentos de
+# archivo (`archive/segment_*.bin`): cada evaluación (JSON + transcripción + CV +
+# estado de entrevista) es un registro comprimido independiente, y el índice
+# (`archive/index.jsonl`) guarda su segmento, offset y longitud, de modo que leer
+# una evaluación archivada solo descomprime su propio registro. Las altas se
+# añaden al final del índice; un borrado RGPD lo reescribe sin la entrada.
+RETENTION_MAX_AGE_DAYS = float(os.getenv("RETENTION_MAX_AGE_DAYS", "180"))
+ARCHIVE_SEGMENT_MAX_BYTES = int(os.getenv("ARCHIVE_SEGMENT_MAX_BYTES", str(64 * 1024 * 1024)))
+ARCHIVE_COMPACT_MIN_DEAD_RATIO = float(os.getenv("ARCHIVE_COMPACT_MIN_DEAD_RATIO", "0.3"))
+ARCHIVE_DNI_KEY = os.getenv("ARCHIVE_DNI_KEY", "")
+
+def require_admin(request: Request):
+    if not is_admin(request):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+def delete_live_files(eval_id: str):
+    for key, path in get_file_paths(eval_id).items():
+        if os.path.exists(path):
+            os.remove(path)
+
+def archive_sort_key(entry: dict) -> str:
+    return entry.get("created_at") or entry["archived_at"]
+
+class ArchiveStore:
+    def __init__(self):
+        self.entries: Dict[str, dict] = {}
+        self.segment_sizes: Dict[int, int] = {}
+        # (huella del DNI, oferta) -> última evaluación archivada
+        self.latest_by_candidate: Dict[tuple, str] = {}
+        self._key: Optional[bytes] = None
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    def _dir(self) -> str:
+        return os.path.join(DATA_DIR, "archive")
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self._dir(), f"segment_{segment:06d}.bin")
+
+    def _index_path(self) -> str:
+        return os.path.join(self._dir(), "index.jsonl")
+
+    def _dni_key(self, create: bool = False) -> Optional[bytes]:
+        """
+        Clave HMAC de las huellas de DNI: ARCHIVE_DNI_KEY o una clave aleatoria
+        persistida. Solo se genera al archivar (`create`); una consulta sin clave
+        en disco devuelve None, porque entonces no hay nada archivado.
+        """
+        if self._key is not None:
+            return self._key
+        if ARCHIVE_DNI_KEY:
+            self._key = ARCHIVE_DNI_KEY.encode("utf-8")
+            return self._key
+        path = os.path.join(self._dir(), "dni.key")
+        if not os.path.exists(path):
+            if not create:
+                return None
+            os.makedirs(self._dir(), exist_ok=True)
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(os.urandom(32))
+        with open(path, "rb") as f:
+            self._key = f.read()
+        return self._key
+
+    def dni_fingerprint(self, dni: str, create: bool = False) -> Optional[str]:
+        """
+        El índice no guarda el DNI en claro sino una huella HMAC con clave: sin la
+        clave no se puede recuperar el DNI probando todos los posibles.
+        """
+        key = self._dni_key(create)
+        if key is None:
+            return None
+        return hmac.new(key, normalize_dni(dni).encode("utf-8"), hashlib.sha256).hexdigest()
+
+    def _track_latest(self, entry: dict):
+        candidate = (entry.get("dni_hmac"), entry.get("offer_id"))
+        current = self.entries.get(self.latest_by_candidate.get(candidate))
+        if current is None or archive_sort_key(entry) >= archive_sort_key(current):
+            self.latest_by_candidate[candidate] = entry["evaluation_id"]
+
+    def ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            # Sin directorio de archivo no hay nada que cargar; se crea al archivar
+            for file in glob(os.path.join(self._dir(), "segment_*.bin")):
+                segment = int(os.path.basename(file)[len("segment_"):-len(".bin")])
+                self.segment_sizes[segment] = os.path.getsize(file)
+            if os.path.exists(self._index_path()):
+                with open(self._index_path(), "r", encoding="utf-8") as f:
+                    for line in f:
+                        if not line.strip():
+                            continue
+                        op = json.loads(line)
+                        if op["op"] == "add":
+                            self.entries[op["evaluation_id"]] = op
+                        else:
+                            self.entries.pop(op["evaluation_id"], None)
+            for entry in self.entries.values():
+                self._track_latest(entry)
+            self._loaded = True
+
+    def _append_index(self, ops: List[dict]):
+        with open(self._index_path(), "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(op) + "\n" for op in ops))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _current_segment(self) -> int:
+        if not self.segment_sizes:
+            self.segment_sizes[0] = 0
+        segment = max(self.segment_sizes)
+        if self.segment_sizes[segment] >= ARCHIVE_SEGMENT_MAX_BYTES:
+            segment += 1
+            self.segment_sizes[segment] = 0
+        return segment
+
+    def _append_record(self, segment: int, payload: bytes) -> int:
+        with open(self._segment_path(segment), "ab") as f:
+            offset = f.tell()
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        self.segment_sizes[segment] = offset + len(payload)
+        return offset
+
+    def read(self, eval_id: str) -> Optional[dict]:
+        """Lee una evaluación archivada descomprimiendo solo su registro."""
+        self.ensure_loaded()
+        entry = self.entries.get(eval_id)
+        if entry is None:
+            return None
+        with timed_phase("disk"):
+            with open(self._segment_path(entry["segment"]), "rb") as f:
+                f.seek(entry["offset"])
+                payload = f.read(entry["length"])
+        with timed_phase("json"):
+            return json.loads(zlib.decompress(payload))
+
+    def archive(self, eval_id: str) -> bool:
+        """Mueve una evaluación viva al archivo y borra sus ficheros sueltos."""
+        paths = get_file_paths(eval_id)
+        if not os.path.exists(paths["eval"]):
+            return False
+        evaluation = load_json(paths["eval"])
+        bundle = {
+            "evaluation": evaluation,
+            "transcript": read_transcript(eval_id),
+            "cv_text": read_cv_text(eval_id),
+            "interview": load_json(paths["interview"]) if os.path.exists(paths["interview"]) else None
+        }
+        payload = zlib.compress(json.dumps(bundle, ensure_ascii=False).encode("utf-8"), 9)
+        with self._lock:
+            self.ensure_loaded()
+            os.makedirs(self._dir(), exist_ok=True)
+            segment = self._current_segment()
+            offset = self._append_record(segment, payload)
+            entry = {
+                "op": "add",
+                "evaluation_id": eval_id,
+                "segment": segment,
+                "offset": offset,
+                "length": len(payload),
+                "dni_hmac": self.dni_fingerprint(evaluation.get("dni", ""), create=True),
+                "offer_id": evaluation.get("offer_id"),
+                "created_at": evaluation.get("created_at"),
+                "archived_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            }
+            # Orden seguro: datos -> índice -> borrado de los ficheros vivos
+            self._append_index([entry])
+            self.entries[eval_id] = entry
+            self._track_latest(entry)
+        delete_live_files(eval_id)
+        return True
+
+    def _rewrite_index(self):
+        """Índice solo con las altas vigentes, sustituido de forma atómica."""
+        tmp_path = f"{self._index_path()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("".join(json.dumps(e) + "\n" for e in self.entries.values()))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._index_path())
+
+    def purge(self, eval_ids: List[str]) -> Dict[str, dict]:
+        """
+        Borra registros archivados sin reescribir los segmentos: sus bytes se
+        sobrescriben con ceros en su sitio y el índice se reescribe sin sus
+        entradas, para que no quede en disco el vínculo entre el DNI y sus
+        evaluaciones. Devuelve el contenido borrado (para retirar sus agregados).
+        """
+        bundles = {eval_id: self.read(eval_id) for eval_id in eval_ids}
+        with self._lock:
+            purged = {}
+            for eval_id, bundle in bundles.items():
+                entry = self.entries.pop(eval_id, None)
+                if entry is None or bundle is None:
+                    continue
+                with open(self._segment_path(entry["segment"]), "r+b") as f:
+                    f.seek(entry["offset"])
+                    f.write(b"\0" * entry["length"])
+                    f.flush()
+                    os.fsync(f.fileno())
+                purged[eval_id] = bundle
+                candidate = (entry.get("dni_hmac"), entry.get("offer_id"))
+                if self.latest_by_candidate.get(candidate) == eval_id:
+                    del self.latest_by_candidate[candidate]
+                    for other in self.entries.values():
+                        if (other.get("dni_hmac"), other.get("offer_id")) == candidate:
+                            self._track_latest(other)
+            if purged:
+                self._rewrite_index()
+        return purged
+
+    def ids_for_dni(self, dni: str) -> List[str]:
+        self.ensure_loaded()
+        fingerprint = self.dni_fingerprint(dni)
+        if fingerprint is None:
+            return []
+        return [eval_id for eval_id, entry in self.entries.items() if entry.get("dni_hmac") == fingerprint]
+
+    def latest(self, dni: str, offer_id: str) -> Optional[str]:
+        """Última evaluación archivada de un candidato para una oferta."""
+        self.ensure_loaded()
+        if not self.entries:
+            return None
+        fingerprint = self.dni_fingerprint(dni)
+        if fingerprint is None:
+            return None
+        return self.latest_by_candidate.get((fingerprint, offer_id))
+
+    def ids_for_offer(self, offer_id: str) -> List[str]:
+        self.ensure_loaded()
+        return [eval_id for eval_id, entry in self.entries.items() if entry.get("offer_id") == offer_id]
+
+    def compact(self) -> dict:
+        """
+        Reescribe los segmentos con demasiado espacio muerto (registros purgados o
+        duplicados) copiando solo los registros vivos, y reescribe el índice.
+        """
+        self.ensure_loaded()
+        with self._lock:
+            live_bytes = {segment: 0 for segment in self.segment_sizes}
+            for entry in self.entries.values():
+                live_bytes[entry["segment"]] = live_bytes.get(entry["segment"], 0) + entry["length"]
+            to_compact = [
+                segment for segment, size in self.segment_sizes.items()
+                if size > 0 and 1 - live_bytes.get(segment, 0) / size >= ARCHIVE_COMPACT_MIN_DEAD_RATIO
+            ]
+            if not to_compact:
+                return {"compacted_segments": 0, "reclaimed_bytes": 0}
+            # Los registros vivos se copian siempre a segmentos nuevos
+            self.segment_sizes[max(self.segment_sizes) + 1] = 0
+            reclaimed = 0
+            for segment in to_compact:
+                moved = [e for e in self.entries.values() if e["segment"] == segment]
+                with open(self._segment_path(segment), "rb") as f:
+                    payloads = []
+                    for entry in moved:
+                        f.seek(entry["offset"])
+                        payloads.append(f.read(entry["length"]))
+                for entry, payload in zip(moved, payloads):
+                    target = self._current_segment()
+                    entry["offset"] = self._append_record(target, payload)
+                    entry["segment"] = target
+                reclaimed += self.segment_sizes[segment] - live_bytes.get(segment, 0)
+
+            self._rewrite_index()
+
+            for segment in to_compact:
+                os.remove(self._segment_path(segment))
+                del self.segment_sizes[segment]
+            return {"compacted_segments": len(to_compact), "reclaimed_bytes": reclaimed}
+
+    def stats(self) -> dict:
+        self.ensure_loaded()
+        return {
+            "archived_evaluations": len(self.entries),
+            "segments": len(self.segment_sizes),
+            "archive_bytes": sum(self.segment_sizes.values())
+        }
+
+archive_store = ArchiveStore()
+
+def forget_evaluation(eval_id: str, data: dict, counted: bool = True):
+    """Retira una evaluación de índices en memoria y agregados."""
+    search_index.remove(eval_id)
+    evaluation_history.remove(eval_id)
+    analytics_store.remove(eval_id)
+    # Una evaluación sustituida por un reenvío ya no cuenta en los agregados de la oferta
+    if counted and data.get("offer_id"):
+        offer_store.remove_evaluation(data["offer_id"], eval_id, data)
+
+def run_archival(max_age_days: float) -> dict:
+    cutoff = time.time() - max_age_days * 86400
+    archived = 0
+    for eval_id, path in live_evaluation_paths():
+        if os.path.getmtime(path) >= cutoff:
+            continue
+        if archive_store.archive(eval_id):
+            # Sigue contando en agregados, analítica e historial de reenvíos, pero no en búsquedas
+            search_index.remove(eval_id)
+            archived += 1
+    return {"archived": archived, **archive_store.stats()}
+
+class PurgeRequest(BaseModel):
+    dni: str
+
+# Endpoints síncronos: FastAPI los ejecuta en el pool de hilos, de modo que el
+# recorrido de ficheros y la compresión no bloquean el bucle de eventos.
+@app.post("/admin/retention/archive")
+def archive_old_evaluations(request: Request, max_age_days: float = Query(default=RETENTION_MAX_AGE_DAYS, ge=0)):
+    """Mover al archivo las evaluaciones sin cambios desde hace más de `max_age_days` días."""
+    require_admin(request)
+    return run_archival(max_age_days)
+
+@app.post("/admin/retention/purge")
+def purge_candidate(request: Request, purge: PurgeRequest):
+    """Borrado RGPD: elimina todas las evaluaciones (vivas y archivadas) de un DNI."""
+    require_admin(request)
+    target = normalize_dni(purge.dni)
+    purged: Dict[str, dict] = {}
+
+    for eval_id, data, _ in iter_live_evaluations():
+        if normalize_dni(data.get("dni", "")) != target:
+            continue
+        delete_live_files(eval_id)
+        purged[eval_id] = data
+
+    for eval_id, bundle in archive_store.purge(archive_store.ids_for_dni(purge.dni)).items():
+        purged[eval_id] = bundle["evaluation"]
+
+    superseded = {data.get("previous_evaluation_id") for data in purged.values()}
+    for eval_id, data in purged.items():
+        forget_evaluation(eval_id, data, counted=eval_id not in superseded)
+
+    return {"purged": len(purged), "evaluation_ids": list(purged)}
+
+@app.post("/admin/retention/compact")
+def compact_archive(request: Request):
+    """Recuperar el espacio de registros purgados reescribiendo los segmentos afectados."""
+    require_admin(request)
+    return archive_store.compact()
+
+@app.get("/admin/retention")
+def retention_status(request: Request):
+    require_admin(request)
+    return {"max_age_days": RETENTION_MAX_AGE_DAYS, **archive_store.stats()}
@@ -161,6 +161,8 @@ INTERVIEW_URL = f"{BACKEND_HOST}/interview"
 START_INTERVIEW_URL = f"{BACKEND_HOST}/interview/start"
 AUDIT_URL = f"{BACKEND_HOST}/audit"
 EVALUATIONS_URL = f"{BACKEND_HOST}/evaluations"
+OFFERS_URL = f"{BACKEND_HOST}/offers"
+ANALYTICS_URL = f"{BACKEND_HOST}/analytics"
 
 # Inicializar Session State
 if "current_eval_id" not in st.session_state:
@@ -223,6 +225,8 @@ with tab1:
                             else:
                                 st.session_state.step = "INTERVIEW"
                             st.rerun()
+                        elif resp.status_code == 503:
+                            st.warning(f"⏳ El sistema está ocupado. Reintenta en {resp.headers.get('Retry-After', 'unos')} segundos.")
                         else:
                             st.error(f"Error: {resp.text}")
                     except Exception as e:
@@ -281,8 +285,12 @@ with tab1:
                             reply = resp.json()["response"]
                             st.write(reply)
                             st.session_state.messages.append({"role": "assistant", "content": reply})
+                            if resp.json().get("finished"):
+                                st.info("✅ Entrevista completada. Pulsa \"Finalizar Entrevista\" para obtener tus resultados.")
                             # Force rerun to save state/show nicely
                             # st.rerun() # Optional, but helps clean UI
+                        elif resp.status_code == 503:
+                            st.warning(f"⏳ El sistema está ocupado. Reintenta en {resp.headers.get('Retry-After', 'unos')} segundos.")
                         else:
                             st.error("Error de comunicación")
                     except Exception as e:
@@ -324,10 +332,82 @@ with tab2:
         if st.button("🔄 Actualizar Tabla", use_container_width=True):
             st.rerun()
 
+    # Agrupación por oferta
+    selected_offer = None
+    try:
+        offers_resp = requests.get(OFFERS_URL)
+        offers = offers_resp.json() if offers_resp.status_code == 200 else []
+    except Exception:
+        offers = []
+
+    if offers:
+        offer_labels = ["Todas las ofertas"] + [f"{o['title']} ({o['candidate_count']})" for o in offers]
+        offer_choice = st.selectbox("Oferta", range(len(offer_labels)), format_func=lambda i: offer_labels[i])
+        if offer_choice > 0:
+            selected_offer = offers[offer_choice - 1]
+
+    if selected_offer:
+        o1, o2, o3 = st.columns(3)
+        with o1:
+            st.metric("Candidatos", selected_offer["candidate_count"])
+        with o2:
+            st.metric("Tasa de Descarte", f"{selected_offer['discard_rate'] * 100:.1f}%")
+        with o3:
+            st.metric("Score Medio", f"{selected_offer['mean_score']:.1f}%")
+
+        try:
+            lb_resp = requests.get(f"{OFFERS_URL}/{selected_offer['offer_id']}/leaderboard", params={"limit": 10})
+            if lb_resp.status_code == 200:
+                leaderboard = lb_resp.json()["leaderboard"]
+                if leaderboard:
+                    st.markdown("#### 🏆 Top Candidatos")
+                    st.table([
+                        {"Candidato": c["candidate_name"], "Score": f"{c['score']:.1f}%", "Estado": "Descartado" if c["discarded"] else "Apto"}
+                        for c in leaderboard
+                    ])
+        except Exception as e:
+            st.error(f"Error al cargar ranking: {e}")
+
+    # Analítica agregada (calculada en el backend, sin descargar registros)
+    with st.expander("📊 Analítica de Evaluaciones"):
+        analytics_params = {"offer_id": selected_offer["offer_id"]} if selected_offer else {}
+        try:
+            a1, a2 = st.columns(2)
+            with a1:
+                st.markdown("**Requisitos más frecuentes no encontrados en el CV**")
+                nf_resp = requests.get(f"{ANALYTICS_URL}/requirements", params={**analytics_params, "status": "not_found", "limit": 10})
+                if nf_resp.status_code == 200 and nf_resp.json():
+                    st.bar_chart(pd.DataFrame(nf_resp.json()).set_index("requirement")["count"])
+                else:
+                    st.caption("Sin datos.")
+            with a2:
+                st.markdown("**Distribución de Score: CV vs. tras Entrevista**")
+                sc_resp = requests.get(f"{ANALYTICS_URL}/scores", params=analytics_params)
+                if sc_resp.status_code == 200:
+                    scores = sc_resp.json()
+                    edges = scores["bin_edges"]
+                    st.bar_chart(pd.DataFrame({
+                        "Análisis CV": scores["before_interview"]["histogram"],
+                        "Tras Entrevista": scores["after_interview"]["histogram"]
+                    }, index=[f"{edges[i]:.0f}-{edges[i + 1]:.0f}" for i in range(len(edges) - 1)]))
+                    if scores["mean_interview_delta"] is not None:
+                        st.caption(f"Variación media tras entrevista: {scores['mean_interview_delta']:+.1f} puntos")
+
+            st.markdown("**Motivos de Descarte**")
+            dr_resp = requests.get(f"{ANALYTICS_URL}/discard-reasons", params=analytics_params)
+            if dr_resp.status_code == 200 and dr_resp.json():
+                st.bar_chart(pd.DataFrame(dr_resp.json()).groupby("reason")["count"].sum())
+            else:
+                st.caption("Sin descartes registrados.")
+        except Exception as e:
+            st.error(f"Error al cargar analítica: {e}")
+
     try:
         resp = requests.get(EVALUATIONS_URL)
         if resp.status_code == 200:
             evals = resp.json()
+            if selected_offer:
+                evals = [e for e in evals if e.get("offer_id") == selected_offer["offer_id"]]
             if evals:
                 df = pd.DataFrame(evals)
                 
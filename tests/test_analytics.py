@@ -0,0 +1,43 @@
+import requests
+import time
+import sys
+
+# Wait for server
+time.sleep(3)
+
+base_url = "http://127.0.0.1:8000/analytics"
+
+try:
+    url = f"{base_url}/requirements"
+    print(f"Testing {url}...")
+    response = requests.get(url, params={"status": "not_found", "limit": 5})
+    if response.status_code != 200:
+        print("Failed with status:", response.status_code)
+        print("Response:", response.text)
+        sys.exit(1)
+    print("Most frequent not_found:", response.json())
+
+    url = f"{base_url}/scores"
+    print(f"Testing {url}...")
+    response = requests.get(url)
+    if response.status_code != 200:
+        print("Failed with status:", response.status_code)
+        print("Response:", response.text)
+        sys.exit(1)
+    data = response.json()
+    print("Before interview:", data.get("before_interview"))
+    print("After interview:", data.get("after_interview"))
+
+    url = f"{base_url}/discard-reasons"
+    print(f"Testing {url}...")
+    response = requests.get(url)
+    if response.status_code == 200:
+        print("Success!")
+        print("Discard reasons:", response.json())
+    else:
+        print("Failed with status:", response.status_code)
+        print("Response:", response.text)
+        sys.exit(1)
+except Exception as e:
+    print(f"Error: {e}")
+    sys.exit(1)
@@ -0,0 +1,80 @@
+import os
+import sys
+import json
+import tempfile
+
+# Prueba en proceso: auditar una evaluación ya sustituida por un reenvío de CV
+# no debe volver a contarla en la oferta ni en la búsqueda
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "evaluador-tecnico", "src", "backend"))
+import engine
+from fastapi.testclient import TestClient
+from langchain_core.messages import AIMessage
+
+class ScriptedLLM:
+    """Modelo de prueba: devuelve en orden las respuestas estructuradas indicadas."""
+    def __init__(self, replies):
+        self.replies = list(replies)
+
+    def with_structured_output(self, schema, **kwargs):
+        return self
+
+    def get_num_tokens(self, text):
+        return len(text) // 4
+
+    async def ainvoke(self, messages, **kwargs):
+        reply = self.replies.pop(0)
+        return {"raw": AIMessage(content=json.dumps(reply)), "parsed": reply, "parsing_error": None}
+
+def analysis(matching, not_found, score):
+    return {
+        "candidate_name": "Pedro Pascal", "dni": "12345678Z",
+        "matching_requirements": matching, "unmatching_requirements": [], "not_found_requirements": not_found,
+        "score": score, "discarded": False, "total_requirements": 2, "red_flags": []
+    }
+
+engine.DATA_DIR = tempfile.mkdtemp()
+engine.llm = ScriptedLLM([
+    analysis(["Python"], ["Docker"], 50.0),
+    analysis(["Python", "Docker"], [], 100.0),
+    {"evaluation": {**analysis(["Python"], [], 50.0), "unmatching_requirements": ["Docker"]}, "key_points": [], "red_flags": []}
+])
+engine._structured_llms.clear()
+client = TestClient(engine.app)
+
+payload = {
+    "cv_text": "Desarrollador Python con 5 años de experiencia.",
+    "offer_text": "Buscamos desarrollador Python. Se valora Docker.",
+    "first_name": "Pedro",
+    "last_name": "Pascal",
+    "dni": "12345678Z"
+}
+
+try:
+    old = client.post("/analyze", json=payload).json()
+    client.post("/interview/start", json={"evaluation_id": old["evaluation_id"]})
+    new = client.post("/analyze", json={**payload, "cv_text": payload["cv_text"] + "\nDocker en producción.", "full_reanalysis": True}).json()
+
+    print("Testing /audit on the replaced evaluation...")
+    response = client.post("/audit", json={"evaluation_id": old["evaluation_id"]})
+    if response.status_code != 200:
+        print("Failed with status:", response.status_code)
+        print("Response:", response.text)
+        sys.exit(1)
+
+    board = client.get(f"/offers/{new['offer_id']}/leaderboard").json()
+    found = client.post("/search/candidates", json={"offer_text": "Python Docker"}).json()["results"]
+    print("Candidate count:", board["candidate_count"], "Mean score:", board["mean_score"])
+    print("Leaderboard:", [(e["evaluation_id"] == new["evaluation_id"], e["score"]) for e in board["leaderboard"]])
+    print("Search results:", len(found))
+
+    if (board["candidate_count"] == 1 and board["mean_score"] == 100.0
+            and [e["evaluation_id"] for e in board["leaderboard"]] == [new["evaluation_id"]]
+            and [r["id"] for r in found] == [new["evaluation_id"]]):
+        print("Verified: the replaced evaluation is audited without re-entering aggregates.")
+    else:
+        print("Failed: the replaced evaluation re-entered the offer or the search index.")
+        sys.exit(1)
+except Exception as e:
+    print(f"Error: {e}")
+    sys.exit(1)
@@ -0,0 +1,53 @@
+import os
+import sys
+import json
+import tempfile
+
+# Prueba en proceso: una entrevista sin requisitos pendientes se cierra sin llamar al LLM
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "evaluador-tecnico", "src", "backend"))
+import engine
+from fastapi.testclient import TestClient
+
+class NoLLM:
+    def __getattr__(self, name):
+        raise AssertionError("Unexpected LLM call")
+
+engine.DATA_DIR = tempfile.mkdtemp()
+engine.llm = NoLLM()
+engine._structured_llms.clear()
+client = TestClient(engine.app)
+
+evaluation_id = "complete"
+with open(engine.get_file_paths(evaluation_id)["eval"], "w", encoding="utf-8") as f:
+    json.dump({
+        "candidate_name": "Pedro Pascal",
+        "matching_requirements": ["Python", "FastAPI"],
+        "unmatching_requirements": [],
+        "not_found_requirements": [],
+        "discarded": False,
+        "score": 100.0
+    }, f)
+
+try:
+    print("Testing /interview/start with no pending requirements...")
+    llm_calls = engine.interview_metrics["llm_calls"]
+    response = client.post("/interview/start", json={"evaluation_id": evaluation_id})
+    if response.status_code != 200:
+        print("Failed with status:", response.status_code)
+        print("Response:", response.text)
+        sys.exit(1)
+    data = response.json()
+    print("Response:", data["response"])
+
+    response = client.post("/interview", json={"evaluation_id": evaluation_id, "message": "Hola", "history": data["history"]})
+    print("Follow-up:", response.json()["response"])
+
+    if data["finished"] and response.json()["finished"] and engine.interview_metrics["llm_calls"] == llm_calls:
+        print("Verified: interview closed from templates without LLM calls.")
+    else:
+        print("Failed: interview did not close without LLM calls.")
+        sys.exit(1)
+except Exception as e:
+    print(f"Error: {e}")
+    sys.exit(1)
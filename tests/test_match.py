@@ -0,0 +1,58 @@
+import requests
+import time
+import sys
+
+# Wait for server
+time.sleep(3)
+
+url = "http://127.0.0.1:8000/match/offers"
+
+offer_backend = """
+Buscamos desarrollador Backend Python Senior.
+Requisitos OBLIGATORIOS:
+- Experiencia demostrable con FastAPI.
+- Uso de Docker para contenedores.
+"""
+
+offer_data = """
+Buscamos Ingeniero de Datos.
+Requisitos OBLIGATORIOS:
+- Python.
+- Experiencia con Spark.
+"""
+
+cv_text = """
+Soy un desarrollador Python con 5 años de experiencia.
+He trabajado intensivamente con FastAPI creando APIs REST.
+"""
+
+payload = {
+    "cv_text": cv_text,
+    "first_name": "Pedro",
+    "last_name": "Pascal",
+    "dni": "12345678Z",
+    "offer_texts": [offer_backend, offer_data]
+}
+
+try:
+    print(f"Testing {url}...")
+    response = requests.post(url, json=payload)
+    if response.status_code == 200:
+        print("Success!")
+        data = response.json()
+        print("Total requirements:", data.get("total_requirements"))
+        print("Unique requirements:", data.get("unique_requirements"))
+        for result in data.get("results", []):
+            print(f"- {result['title']}: score {result['analysis']['score']} (discarded: {result['analysis']['discarded']})")
+
+        if len(data.get("results", [])) == 2:
+            print("Verified: one AnalysisResult per offer.")
+        else:
+            print("Warning: unexpected number of results.")
+    else:
+        print("Failed with status:", response.status_code)
+        print("Response:", response.text)
+        sys.exit(1)
+except Exception as e:
+    print(f"Error: {e}")
+    sys.exit(1)
@@ -0,0 +1,50 @@
+import requests
+import time
+import sys
+
+# Wait for server
+time.sleep(3)
+
+base_url = "http://127.0.0.1:8000/offers"
+
+offer_text = """
+Buscamos desarrollador Backend Python Senior.
+Requisitos OBLIGATORIOS:
+- Experiencia demostrable con FastAPI.
+- Uso de Docker para contenedores.
+"""
+
+try:
+    print(f"Testing {base_url}...")
+    response = requests.post(base_url, json={"offer_text": offer_text})
+    if response.status_code != 200:
+        print("Failed with status:", response.status_code)
+        print("Response:", response.text)
+        sys.exit(1)
+
+    offer = response.json()
+    print("Offer ID:", offer["offer_id"])
+
+    # Registrar la misma oferta de nuevo debe devolver el mismo ID
+    again = requests.post(base_url, json={"offer_text": offer_text}).json()
+    if again["offer_id"] == offer["offer_id"]:
+        print("Verified: offer registration is idempotent.")
+    else:
+        print("Warning: duplicated offer created for the same text.")
+
+    url = f"{base_url}/{offer['offer_id']}/leaderboard"
+    print(f"Testing {url}...")
+    response = requests.get(url, params={"limit": 5})
+    if response.status_code == 200:
+        print("Success!")
+        data = response.json()
+        print("Candidates:", data.get("candidate_count"))
+        print("Discard rate:", data.get("discard_rate"))
+        print("Leaderboard:", data.get("leaderboard"))
+    else:
+        print("Failed with status:", response.status_code)
+        print("Response:", response.text)
+        sys.exit(1)
+except Exception as e:
+    print(f"Error: {e}")
+    sys.exit(1)
@@ -0,0 +1,52 @@
+import os
+import sys
+import json
+import asyncio
+import tempfile
+
+# Prueba en proceso: la re-evaluación sin requisitos afectados no llama al LLM
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "evaluador-tecnico", "src", "backend"))
+import engine
+
+class NoLLM:
+    def __getattr__(self, name):
+        raise AssertionError("Unexpected LLM call")
+
+engine.DATA_DIR = tempfile.mkdtemp()
+engine.llm = NoLLM()
+engine._structured_llms.clear()
+
+previous_id = "previous"
+old_cv = "Desarrollador Python con 5 años de experiencia.\nAficiones: ajedrez."
+new_cv = "Desarrollador Python con 5 años de experiencia.\nAficiones: ajedrez y senderismo."
+previous = {
+    "candidate_name": "Pedro Pascal",
+    "matching_requirements": ["Python"],
+    "unmatching_requirements": ["Experiencia con Docker (obligatorio)"],
+    "not_found_requirements": [],
+    "discarded": True,
+    "score": 0,
+    "red_flags": [f"{engine.DISCARD_FLAG_PREFIX} Docker"]
+}
+paths = engine.get_file_paths(previous_id)
+with open(paths["eval"], "w", encoding="utf-8") as f:
+    json.dump(previous, f)
+with open(paths["cv"], "w", encoding="utf-8") as f:
+    f.write(old_cv)
+
+try:
+    print("Testing incremental re-evaluation with an unrelated CV change...")
+    result = asyncio.run(engine.incremental_reanalysis(previous_id, "Oferta Python. Docker OBLIGATORIO.", new_cv))
+    engine.recalculate_score(result)
+    print("Re-evaluated requirements:", result["reevaluated_requirements"])
+    print("Discarded:", result["discarded"], "Score:", result["score"])
+    print("Red flags:", result["red_flags"])
+    if result["reevaluated_requirements"] == 0 and result["discarded"] and result["score"] == 0:
+        print("Verified: the mandatory discard is carried over.")
+    else:
+        print("Failed: the discard was dropped.")
+        sys.exit(1)
+except Exception as e:
+    print(f"Error: {e}")
+    sys.exit(1)
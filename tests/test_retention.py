@@ -0,0 +1,59 @@
+import os
+import requests
+import time
+import sys
+
+# Wait for server
+time.sleep(3)
+
+base_url = "http://127.0.0.1:8000"
+dni = "00000000T"
+# Los endpoints de administración exigen el mismo ADMIN_TOKEN que el servidor
+headers = {"X-Admin-Token": os.getenv("ADMIN_TOKEN", "")}
+
+payload = {
+    "cv_text": "Desarrollador Python con experiencia en FastAPI y Docker.",
+    "first_name": "Borrar",
+    "last_name": "Prueba",
+    "dni": dni,
+    "offer_texts": ["Buscamos desarrollador Python. Requisito OBLIGATORIO: FastAPI."],
+    "persist": True
+}
+
+try:
+    print("Testing /admin/retention/archive...")
+    response = requests.post(f"{base_url}/admin/retention/archive", params={"max_age_days": 36500}, headers=headers)
+    if response.status_code != 200:
+        print("Failed with status:", response.status_code)
+        print("Response:", response.text)
+        sys.exit(1)
+    print("Archive status:", response.json())
+
+    print("Creating evaluation to purge...")
+    response = requests.post(f"{base_url}/match/offers", json=payload)
+    if response.status_code != 200:
+        print("Failed with status:", response.status_code)
+        sys.exit(1)
+    eval_id = response.json()["results"][0]["analysis"]["evaluation_id"]
+
+    print("Testing /admin/retention/purge...")
+    response = requests.post(f"{base_url}/admin/retention/purge", json={"dni": dni}, headers=headers)
+    data = response.json()
+    print("Purged:", data.get("purged"))
+    if eval_id not in data.get("evaluation_ids", []):
+        print("Failed: evaluation was not purged.")
+        sys.exit(1)
+
+    response = requests.get(f"{base_url}/evaluations/{eval_id}")
+    if response.status_code == 404:
+        print("Verified: purged evaluation is no longer available.")
+    else:
+        print("Failed: purged evaluation still available.")
+        sys.exit(1)
+
+    print("Testing /admin/retention/compact...")
+    response = requests.post(f"{base_url}/admin/retention/compact", headers=headers)
+    print("Compaction:", response.json())
+except Exception as e:
+    print(f"Error: {e}")
+    sys.exit(1)
@@ -0,0 +1,36 @@
+import requests
+import time
+import sys
+
+# Wait for server
+time.sleep(3)
+
+url = "http://127.0.0.1:8000/search/candidates"
+
+payload = {
+    "offer_text": "Buscamos desarrollador Backend Python con FastAPI y Docker.",
+    "top_k": 5,
+    "discarded": False
+}
+
+try:
+    print(f"Testing {url}...")
+    response = requests.post(url, json=payload)
+    if response.status_code == 200:
+        print("Success!")
+        data = response.json()
+        print("Took (ms):", data.get("took_ms"))
+        for candidate in data.get("results", []):
+            print(f"- {candidate['candidate_name']} (score {candidate['score']}, similarity {candidate['similarity']})")
+
+        if any(c.get("discarded") for c in data.get("results", [])):
+            print("Warning: discarded candidates returned despite filter.")
+        else:
+            print("Verified: discarded filter applied.")
+    else:
+        print("Failed with status:", response.status_code)
+        print("Response:", response.text)
+        sys.exit(1)
+except Exception as e:
+    print(f"Error: {e}")
+    sys.exit(1)
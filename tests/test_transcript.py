@@ -0,0 +1,43 @@
+import requests
+import time
+import sys
+
+# Wait for server
+time.sleep(3)
+
+base_url = "http://127.0.0.1:8000/evaluations"
+
+try:
+    evaluations = requests.get(base_url).json()
+    if not evaluations:
+        print("No evaluations available to test transcripts.")
+        sys.exit(1)
+    evaluation_id = evaluations[0]["id"]
+
+    url = f"{base_url}/{evaluation_id}/transcript/tail"
+    print(f"Testing {url}...")
+    response = requests.get(url, params={"turns": 2})
+    if response.status_code != 200:
+        print("Failed with status:", response.status_code)
+        print("Response:", response.text)
+        sys.exit(1)
+    records = response.json()
+    print("Last turns:", [r["turn"] for r in records])
+
+    url = f"{base_url}/{evaluation_id}/transcript/range"
+    print(f"Testing {url}...")
+    response = requests.get(url, params={"start": 0, "end": 1})
+    if response.status_code == 200:
+        print("Success!")
+        records = response.json()
+        if all(0 <= r["turn"] <= 1 for r in records):
+            print("Verified: range limited to turns 0-1.")
+        else:
+            print("Warning: records outside requested range.")
+    else:
+        print("Failed with status:", response.status_code)
+        print("Response:", response.text)
+        sys.exit(1)
+except Exception as e:
+    print(f"Error: {e}")
+    sys.exit(1)